@@ -6,6 +6,12 @@ Usage:
   python autograder.py
   python autograder.py --verbose (for more detailed output)
   python autograder.py --test example_csp_test (to run a specific test)
+  python autograder.py --jobs 4 --timeout 30
+
+Each test runs in its own worker process, up to --jobs of them at once, so
+a crash or a variable left assigned cannot leak into another test, and a
+test still running after --timeout seconds is killed. After the scores a
+table gives each test's wall time, CPU time and peak resident memory.
 
 Implementing tests:
 To add a new test, create a new test function that takes a propagator 
@@ -22,35 +28,37 @@ The test function should be of the form:
 """
 
 import argparse
-import signal
 import traceback
 import itertools
 import io
 import contextlib
+import multiprocessing
+import multiprocessing.connection
+import os
+import resource
+import tempfile
+import time
 
 import cspbase
 import propagators as soln_propagators
 
 TIMEOUT = 60
 
+#Futoshiki boards shared by several tests (4x4, in the grid format of
+#the models). Tests that edit a board work on a copy.
+#one solution, found by GAC with a little search
+BOARD_ONE_GIVEN = [[0, '<', 0, '.', 0, '.', 0], [0, '.', 0, '.', 2, '.', 0],
+                   [0, '.', 0, '.', 0, '>', 0], [0, '.', 0, '.', 0, '.', 0]]
+#GAC alone has to guess; the Latin-square rules do not
+BOARD_TWO_FOURS = [[0, '.', 0, '.', 0, '>', 0], [0, '.', 0, '>', 0, '.', 0],
+                   [4, '>', 0, '.', 0, '.', 0], [0, '.', 0, '.', 0, '.', 4]]
+#unsolvable: two 1s in the first column
+BOARD_TWO_ONES = [[1, '.', 0, '.', 0, '.', 0], [0, '.', 0, '.', 0, '.', 0],
+                  [1, '.', 0, '.', 0, '.', 0], [0, '.', 0, '.', 0, '.', 0]]
+
 #######################################
-# UTILITIES & TIMEOUTS
+# UTILITIES
 #######################################
-class TimeoutException(Exception):
-    """Raised when time is up."""
-    pass
-
-def _timeout_handler(signum, frame):
-    raise TimeoutException("Timeout occurred")
-
-def set_timeout(seconds):
-    signal.signal(signal.SIGALRM, _timeout_handler)
-    signal.alarm(seconds)
-
-def reset_timeout():
-    """Disable alarm."""
-    signal.alarm(0)
-
 def contains_list(lst):
     return any(isinstance(e, list) for e in lst)
 
@@ -109,12 +117,10 @@ def example_csp_test(propagator, name=""):
     btracker = cspbase.BT(simple_csp)
     # btracker.trace_on()
 
-    set_timeout(TIMEOUT)
     btracker.bt_search(propagator)
     curr_vars = simple_csp.get_all_vars()
     answer = [[2], [1], [1], [4]]
     var_vals = [x.cur_domain() for x in curr_vars]
-    reset_timeout()
     if var_vals != answer:
         details = "Failed while testing a propagator (%s): variable domains don't match expected results" % name
         return 0, details, 1
@@ -122,6 +128,703 @@ def example_csp_test(propagator, name=""):
         return 1, "", 1
  
 
+def decompose_test(propagator, name=""):
+    # A, B, C pairwise different over {1, 2, 3} and, independent of them,
+    # X, Y, Z pairwise different: solvable over {1, 2, 3}, not over {1, 2}.
+    # Searching the two parts separately (in this process or in parallel)
+    # must give the same answers as one search, and a failure must leave
+    # every domain as it was.
+    for parallel in (False, True):
+        for xyz_dom in ([1, 2, 3], [1, 2]):
+            abc = [cspbase.Variable(n, [1, 2, 3]) for n in "ABC"]
+            xyz = [cspbase.Variable(n, xyz_dom) for n in "XYZ"]
+            csp = cspbase.CSP("TwoParts", abc + xyz)
+            for part in (abc, xyz):
+                for u, v in itertools.combinations(part, 2):
+                    c = cspbase.Constraint(u.name + v.name, [u, v])
+                    c.add_satisfying_tuples([t for t in itertools.product(u.domain(), v.domain())
+                                             if t[0] != t[1]])
+                    csp.add_constraint(c)
+            btracker = cspbase.BT(csp)
+            btracker.quiet_on()
+            status = btracker.bt_search(propagator, decompose=True, parallel=parallel)
+            if len(xyz_dom) == 3:
+                ok = status and all(len(set(v.get_assigned_value() for v in part)) == 3
+                                    for part in (abc, xyz))
+            else:
+                ok = status == False and all(not v.is_assigned() and v.cur_domain() == v.domain()
+                                             for v in abc + xyz)
+            if not ok:
+                details = "Failed while testing decompose (%s, parallel=%s): wrong result for domain %s" % (
+                    name, parallel, xyz_dom)
+                return 0, details, 1
+    return 1, "", 1
+
+def lcv_test(propagator, name=""):
+    # X > Y over {1, 2, 3}: X = 3 leaves Y two values, X = 2 one and X = 1
+    # none, so least constraining value tries X in the order 3, 2, 1. The
+    # support counts must follow prunings and assignments of Y.
+    x = cspbase.Variable('X', [1, 2, 3])
+    y = cspbase.Variable('Y', [1, 2, 3])
+    c = cspbase.Constraint('XgtY', [x, y])
+    c.add_satisfying_tuples([t for t in itertools.product(x.domain(), y.domain()) if t[0] > t[1]])
+    csp = cspbase.CSP("LCV", [x, y])
+    csp.add_constraint(c)
+
+    def x_counts():
+        return dict((val, n) for val, n in c.support_counts()[0].items() if n)
+
+    order = soln_propagators.val_lcv(csp, x)
+    if order != [3, 2, 1]:
+        details = "Failed while testing LCV (%s): value order %s, expected [3, 2, 1]" % (name, order)
+        return 0, details, 1
+    steps = [(lambda: y.prune_value(1), {3: 1}),
+             (lambda: y.assign(3), {}),
+             (lambda: y.unassign(), {3: 1}),
+             (lambda: y.unprune_value(1), {3: 2, 2: 1})]
+    for k, (step, expected) in enumerate(steps):
+        step()
+        if x_counts() != expected:
+            details = "Failed while testing LCV (%s): support counts %s after step %d, expected %s" % (
+                name, x_counts(), k + 1, expected)
+            return 0, details, 1
+
+    # Tables of up to LCV_MAX_TABLE tuples are scored, larger ones are
+    # skipped: with X = 1 supported by all but one tuple, X = 1 goes first
+    # exactly when the table is within the limit.
+    for extra, expected in ((0, [1, 0]), (1, [0, 1])):
+        x = cspbase.Variable('X', [0, 1])
+        y = cspbase.Variable('Y', list(range(soln_propagators.LCV_MAX_TABLE)))
+        c = cspbase.Constraint('XY', [x, y])
+        c.add_satisfying_tuples([(0, k) for k in range(1 + extra)] +
+                                [(1, k) for k in range(soln_propagators.LCV_MAX_TABLE - 1)])
+        csp = cspbase.CSP("LCVLimit", [x, y])
+        csp.add_constraint(c)
+        order = soln_propagators.val_lcv(csp, x)
+        if order != expected:
+            details = "Failed while testing LCV (%s): value order %s with a table of %d tuples, expected %s" % (
+                name, order, len(c.table), expected)
+            return 0, details, 1
+    return 1, "", 1
+
+def sac_test(propagator, name=""):
+    # x, y, z pairwise different with y, z in {1, 2}: GAC prunes nothing
+    # but only x = 3 survives a singleton probe.
+    x = cspbase.Variable('X', [1, 2, 3])
+    y = cspbase.Variable('Y', [1, 2])
+    z = cspbase.Variable('Z', [1, 2])
+    csp = cspbase.CSP("SAC", [x, y, z])
+    for a, b in ((x, y), (y, z), (x, z)):
+        c = cspbase.Constraint('NE', [a, b])
+        c.add_satisfying_tuples([t for t in itertools.product([1, 2, 3], repeat=2) if t[0] != t[1]])
+        csp.add_constraint(c)
+
+    for incremental in (False, True):
+        status, prunings = soln_propagators.sac_enforce(csp, propagator, incremental=incremental)
+        doms = [v.cur_domain() for v in csp.get_all_vars()]
+        for var, val in prunings:
+            var.unprune_value(val)
+        if not status or doms != [[3], [1, 2], [1, 2]]:
+            details = "Failed while testing SAC with a propagator (%s): domains %s" % (name, doms)
+            return 0, details, 1
+    return 1, "", 1
+
+def check_futoshiki_solution(board, var_array):
+    """Return True if var_array holds a solution of the Futoshiki board."""
+    n = len(board)
+    for i in range(n):
+        row = [v.get_assigned_value() for v in var_array[i]]
+        col = [var_array[r][i].get_assigned_value() for r in range(n)]
+        if sorted(row) != list(range(1, n + 1)) or sorted(col) != list(range(1, n + 1)):
+            return False
+        for j, cell in enumerate(board[i]):
+            if cell == '<' and not row[j // 2] < row[j // 2 + 1]:
+                return False
+            if cell == '>' and not row[j // 2] > row[j // 2 + 1]:
+                return False
+            if isinstance(cell, int) and cell != 0 and row[j // 2] != cell:
+                return False
+    return True
+
+def futoshiki_model_test(model, name=""):
+    # Two boards of the same size share the cached tables of the model;
+    # solving one must not affect the other.
+    boards = [
+        BOARD_ONE_GIVEN,
+        [[0, '.', 0, '.', 3, '.', 0], [0, '>', 0, '.', 0, '.', 0],
+         [0, '.', 0, '<', 0, '.', 0], [0, '.', 0, '.', 0, '.', 0]],
+    ]
+    for board in boards:
+        csp, var_array = model(board)
+        btracker = cspbase.BT(csp)
+        btracker.bt_search(soln_propagators.prop_GAC, soln_propagators.ord_mrv)
+        if not check_futoshiki_solution(board, var_array):
+            details = "Failed while testing a model (%s): board not solved correctly" % name
+            return 0, details, 1
+    return 1, "", 1
+
+
+def futoshiki_propagator_test(model, name=""):
+    # GAC alone has to guess on this board; with the Latin-square rules no
+    # guess is wrong, so each of the 16 cells is assigned exactly once.
+    board = BOARD_TWO_FOURS
+    csp, var_array = model(board)
+    btracker = cspbase.BT(csp)
+    btracker.bt_search(soln_propagators.FutoshikiPropagator(var_array), soln_propagators.ord_mrv)
+    if not check_futoshiki_solution(board, var_array):
+        details = "Failed while testing the Futoshiki propagator (%s): board not solved correctly" % name
+        return 0, details, 1
+    if btracker.nDecisions != 16:
+        details = "Failed while testing the Futoshiki propagator (%s): %d assignments made, expected 16" % (
+            name, btracker.nDecisions)
+        return 0, details, 1
+    return 1, "", 1
+
+def count_solutions_test(model, name=""):
+    # There are 12 Latin squares of size 3; a uniqueness check stops at the
+    # second solution, and the board below has exactly one.
+    empty = [[0, '.', 0, '.', 0]] * 3
+    csp, var_array = model(empty)
+    btracker = cspbase.BT(csp)
+    counts = [btracker.count_solutions(soln_propagators.prop_GAC),
+              btracker.count_solutions(soln_propagators.prop_GAC, limit=2)]
+    board = [[0, '.', 0, '.', 0], [0, '>', 0, '>', 0], [0, '>', 0, '.', 0]]
+    csp, var_array = model(board)
+    counts.append(cspbase.BT(csp).count_solutions(soln_propagators.prop_FC, limit=2))
+    if counts != [12, 2, 1]:
+        details = "Failed while testing count_solutions (%s): counted %s, expected [12, 2, 1]" % (
+            name, counts)
+        return 0, details, 1
+    if any(v.is_assigned() or v.cur_domain_size() != 3 for v in csp.get_all_vars()):
+        details = "Failed while testing count_solutions (%s): variables not restored" % name
+        return 0, details, 1
+    return 1, "", 1
+
+def checkpoint_test(model, name=""):
+    # Stop a search half way with checkpointing on, then resume it on a
+    # freshly built CSP: it must end with the same solution and the same
+    # number of assignments as a search that was never stopped.
+    board = BOARD_TWO_FOURS
+    csp, var_array = model(board)
+    btracker = cspbase.BT(csp)
+    btracker.bt_search(soln_propagators.prop_BT)
+    expected = ([[v.get_assigned_value() for v in row] for row in var_array], btracker.nDecisions)
+
+    path = os.path.join(tempfile.mkdtemp(), "search.ckpt")
+    csp, var_array = model(board)
+    btracker = cspbase.BT(csp)
+    btracker.checkpoint_on(path)
+    def stop_half_way(csp, var):
+        if btracker.nDecisions >= expected[1] // 2:
+            btracker.request_stop()
+        return var.cur_domain()
+    if btracker.bt_search(soln_propagators.prop_BT, None, stop_half_way) is not None or not os.path.exists(path):
+        details = "Failed while testing checkpoints (%s): search was not stopped and saved" % name
+        return 0, details, 1
+
+    csp, var_array = model(board)
+    btracker = cspbase.BT(csp)
+    btracker.bt_search(soln_propagators.prop_BT, resume=path)
+    got = ([[v.get_assigned_value() for v in row] for row in var_array], btracker.nDecisions)
+    if got != expected:
+        details = "Failed while testing checkpoints (%s): resumed search gave %s, expected %s" % (
+            name, got, expected)
+        return 0, details, 1
+    return 1, "", 1
+
+def compile_test(model, name=""):
+    # Saving a CSP and loading it back must give the same variables,
+    # domains, scopes, tuples (shared tables written once) and event
+    # subscriptions, and the loaded CSP must solve to the same solution
+    # with the same search effort.
+    import csp_compile
+    board = BOARD_ONE_GIVEN
+    csp, var_array = model(board)
+    path = os.path.join(tempfile.mkdtemp(), "board.cspc")
+    csp_compile.save_csp(csp, path, var_array)
+    loaded, loaded_array = csp_compile.load_csp(path)
+
+    if [(v.name, v.domain()) for v in csp.get_all_vars()] != \
+       [(v.name, v.domain()) for v in loaded.get_all_vars()] or \
+       [[v.name for v in row] for row in var_array] != [[v.name for v in row] for row in loaded_array]:
+        details = "Failed while testing compiled CSPs (%s): variables differ after loading" % name
+        return 0, details, 1
+    for c, d in zip(csp.get_all_cons(), loaded.get_all_cons()):
+        if [v.name for v in c.get_scope()] != [v.name for v in d.get_scope()] or \
+           sorted(c.table) != sorted(d.table) or c.events != d.events:
+            details = "Failed while testing compiled CSPs (%s): constraint %s differs after loading" % (name, c.name)
+            return 0, details, 1
+    if len(set(id(c.table) for c in csp.get_all_cons())) != len(set(id(c.table) for c in loaded.get_all_cons())):
+        details = "Failed while testing compiled CSPs (%s): shared tables not kept shared" % name
+        return 0, details, 1
+
+    if len(set(c.events for c in loaded.get_all_cons())) < 2:
+        details = "Failed while testing compiled CSPs (%s): expected mixed event subscriptions" % name
+        return 0, details, 1
+
+    original = cspbase.BT(csp)
+    original.bt_search(soln_propagators.prop_GAC, soln_propagators.ord_mrv)
+    reloaded = cspbase.BT(loaded)
+    reloaded.bt_search(soln_propagators.prop_GAC, soln_propagators.ord_mrv)
+    if [[v.get_assigned_value() for v in row] for row in var_array] != \
+       [[v.get_assigned_value() for v in row] for row in loaded_array]:
+        details = "Failed while testing compiled CSPs (%s): loaded CSP solved differently" % name
+        return 0, details, 1
+    if (original.nDecisions, original.nPrunings) != (reloaded.nDecisions, reloaded.nPrunings):
+        details = "Failed while testing compiled CSPs (%s): %d assignments and %d prunings after loading, expected %d and %d" % (
+            name, reloaded.nDecisions, reloaded.nPrunings, original.nDecisions, original.nPrunings)
+        return 0, details, 1
+    return 1, "", 1
+
+def memory_report_test(model, name=""):
+    # The parts of the report must add up to its total, and a table shared
+    # by several constraints (as the model's tables are) counted only once.
+    board = BOARD_ONE_GIVEN
+    csp, var_array = model(board)
+    report = csp.memory_report()
+    parts = ['variables', 'constraints', 'tables', 'index']
+    if sorted(report) != sorted(parts + ['total']) or \
+       report['total'] != sum(report[k] for k in parts):
+        details = "Failed while testing memory reports (%s): report %s" % (name, report)
+        return 0, details, 1
+    tables = dict((id(c.table), c.table) for c in csp.get_all_cons())
+    if len(tables) == len(csp.get_all_cons()) or \
+       report['tables'] != sum(t.memory_size() for t in tables.values()):
+        details = "Failed while testing memory reports (%s): %d bytes of tables, expected %d in %d shared tables" % (
+            name, report['tables'], sum(t.memory_size() for t in tables.values()), len(tables))
+        return 0, details, 1
+    return 1, "", 1
+
+def batch_test(model, name=""):
+    # A batch mixing boards that propagation alone solves, boards that need
+    # search and an unsolvable board (two 1s in the first column).
+    import futoshiki_batch
+    boards = [
+        BOARD_ONE_GIVEN,
+        [[0, '.', 0, '.', 0, '.', 0], [0, '.', 0, '.', 0, '.', 0],
+         [0, '.', 0, '.', 0, '.', 0], [0, '.', 0, '.', 0, '.', 0]],
+        BOARD_TWO_ONES,
+        BOARD_TWO_FOURS,
+        [[0, '.', 0, '.', 4, '.', 0], [1, '.', 0, '.', 0, '.', 4],
+         [3, '.', 0, '.', 1, '.', 0], [0, '.', 3, '.', 0, '.', 0]],
+    ]
+    solutions = futoshiki_batch.solve_batch(boards, model=1)
+    for k, (board, solution) in enumerate(zip(boards, solutions)):
+        if (solution is None) != (k == 2):
+            details = "Failed while testing batch solving (%s): board %d %s" % (
+                name, k, "solved but has no solution" if k == 2 else "not solved")
+            return 0, details, 1
+        if solution is None:
+            continue
+        csp, var_array = model(board)
+        for row, values in zip(var_array, solution):
+            for var, val in zip(row, values):
+                var.assign(val)
+        if not check_futoshiki_solution(board, var_array):
+            details = "Failed while testing batch solving (%s): board %d solved incorrectly" % (name, k)
+            return 0, details, 1
+    return 1, "", 1
+
+def min_conflicts_test(model, name=""):
+    # Local search must find a solution of a board that has one, and give
+    # up, leaving nothing assigned, on a CSP that has none (three variables
+    # that must pairwise differ but only have two values).
+    board = BOARD_TWO_FOURS
+    csp, var_array = model(board)
+    solver = cspbase.MinConflicts(csp, seed=0)
+    if not solver.mc_search() or not check_futoshiki_solution(board, var_array):
+        details = "Failed while testing min-conflicts (%s): board not solved correctly" % name
+        return 0, details, 1
+
+    vars = [cspbase.Variable(v, [1, 2]) for v in "XYZ"]
+    csp = cspbase.CSP("Triangle", vars)
+    for a, b in itertools.combinations(vars, 2):
+        c = cspbase.Constraint("NE", [a, b])
+        c.add_satisfying_tuples([(1, 2), (2, 1)])
+        csp.add_constraint(c)
+    solver = cspbase.MinConflicts(csp, seed=0)
+    if solver.mc_search(max_steps=200) or solver.nSteps != 200 or any(v.is_assigned() for v in vars):
+        details = "Failed while testing min-conflicts (%s): unsolvable CSP not handled" % name
+        return 0, details, 1
+    return 1, "", 1
+
+def branch_and_bound_test(propagator, name=""):
+    # Minimize the sum of the diagonal and maximize the agreement with a
+    # preferred board; the optima are checked against all the solutions.
+    import futoshiki_csp
+    board = BOARD_ONE_GIVEN
+    preferred = [[4, 3, 2, 1], [4, 3, 2, 1], [1, 2, 3, 4], [1, 2, 3, 4]]
+    csp, var_array = futoshiki_csp.futoshiki_csp_model_1(board)
+    objectives = [({var_array[i][i]: (lambda val: val) for i in range(4)}, False),
+                  ({var_array[i][j]: (lambda val, p=preferred[i][j]: val == p)
+                    for i in range(4) for j in range(4)}, True)]
+    btracker = cspbase.BT(csp)
+    btracker.count_solutions(propagator)
+    for objective, maximize in objectives:
+        values = [sum(objective[v](sol[v]) for v in objective) for sol in btracker.solutions]
+        best = max(values) if maximize else min(values)
+        improvements = []
+        solver = cspbase.BT(csp)
+        status = solver.bb_search(propagator, objective, soln_propagators.ord_mrv, maximize=maximize,
+                                  on_improve=lambda value, solution: improvements.append(value))
+        got = sum(objective[v](v.get_assigned_value()) for v in objective)
+        if not status or got != best or not check_futoshiki_solution(board, var_array):
+            details = "Failed while testing branch and bound (%s): objective %s, expected %s" % (
+                name, got, best)
+            return 0, details, 1
+        if improvements[-1] != best or improvements != sorted(improvements, reverse=not maximize):
+            details = "Failed while testing branch and bound (%s): improvements reported %s" % (
+                name, improvements)
+            return 0, details, 1
+    # The bounded searches must leave the root cache keyed on the wrapped
+    # propagator only, however often they run: more runs than the cache
+    # has slots would otherwise push out every useful entry. GAC prunes at
+    # the root, so its result is worth caching.
+    objective = objectives[0][0]
+    gac = soln_propagators.prop_GAC
+    for _ in range(cspbase.ROOT_CACHE_SIZE + 1):
+        cspbase.BT(csp).bb_search(gac, objective, soln_propagators.ord_mrv)
+    if list(csp.root_cache) != [gac]:
+        details = "Failed while testing branch and bound (%s): root cache keys %s" % (
+            name, [getattr(key, '__name__', key) for key in csp.root_cache])
+        return 0, details, 1
+    return 1, "", 1
+
+def adaptive_propagator_test(model, name=""):
+    # Whichever propagator it picks at each depth, the adaptive propagator
+    # must solve the boards and find the unsolvable one (two 1s in a column).
+    boards = [BOARD_ONE_GIVEN, BOARD_TWO_FOURS, BOARD_TWO_ONES]
+    for k, board in enumerate(boards):
+        csp, var_array = model(board)
+        btracker = cspbase.BT(csp)
+        status = btracker.bt_search(soln_propagators.AdaptivePropagator(), soln_propagators.ord_mrv)
+        if status != (k != 2) or (status and not check_futoshiki_solution(board, var_array)):
+            details = "Failed while testing the adaptive propagator (%s): board %d not solved correctly" % (
+                name, k)
+            return 0, details, 1
+    return 1, "", 1
+
+
+def variable_ordering_test(model, name=""):
+    # dom/wdeg and impact ordering must solve the boards and find the
+    # unsolvable one, and the dead ends of the last must raise weights.
+    boards = [
+        BOARD_ONE_GIVEN,
+        BOARD_TWO_FOURS,
+        [[0, '<', 0, '<', 0, '.', 0], [0, '.', 0, '.', 0, '.', 0],
+         [0, '.', 0, '.', 0, '.', 0], [0, '.', 0, '.', 0, '>', 4]],
+    ]
+    for ordering in ("dom/wdeg", "impact"):
+        for k, board in enumerate(boards):
+            csp, var_array = model(board)
+            btracker = cspbase.BT(csp)
+            if ordering == "dom/wdeg":
+                status = btracker.bt_search(soln_propagators.prop_FC, soln_propagators.ord_dom_wdeg)
+            else:
+                impact = soln_propagators.ImpactOrdering()
+                status = btracker.bt_search(impact.propagator(soln_propagators.prop_FC), impact)
+            if status != (k != 2) or (status and not check_futoshiki_solution(board, var_array)):
+                details = "Failed while testing %s ordering (%s): board %d not solved correctly" % (
+                    ordering, name, k)
+                return 0, details, 1
+            if ordering == "dom/wdeg" and k == 2 and not any(c.weight > 1 for c in csp.get_all_cons()):
+                details = "Failed while testing dom/wdeg ordering (%s): no constraint weight was bumped" % name
+                return 0, details, 1
+
+    # constraints of another CSP over the same variables must not count
+    csp, var_array = model(boards[0])
+    first = soln_propagators.ord_dom_wdeg(csp)
+    other = cspbase.CSP("Other", csp.get_all_vars())
+    rival = [var for var in csp.get_all_vars() if var is not first][0]
+    for var in csp.get_all_vars():
+        if var is not rival:
+            c = cspbase.Constraint("Heavy", [var, rival])
+            c.weight = 1000
+            other.add_constraint(c)
+    if soln_propagators.ord_dom_wdeg(csp) is not first:
+        details = "Failed while testing dom/wdeg ordering (%s): weights of another CSP's constraints counted" % name
+        return 0, details, 1
+    return 1, "", 1
+
+def root_cache_test(model, name=""):
+    # A second search of the same CSP with the same propagator must reuse
+    # the cached root propagation; adding a constraint must invalidate it.
+    board = BOARD_ONE_GIVEN
+    roots = []
+    def counting_prop(csp, newVar=None):
+        if newVar is None:
+            roots.append(newVar)
+        return soln_propagators.prop_GAC(csp, newVar)
+
+    csp, var_array = model(board)
+    for k in range(2):
+        btracker = cspbase.BT(csp)
+        if not btracker.bt_search(counting_prop, soln_propagators.ord_mrv) \
+           or not check_futoshiki_solution(board, var_array):
+            details = "Failed while testing the root cache (%s): board not solved on search %d" % (name, k + 1)
+            return 0, details, 1
+    if len(roots) != 1:
+        details = "Failed while testing the root cache (%s): root propagation ran %d times in two searches" % (
+            name, len(roots))
+        return 0, details, 1
+
+    #rule out the value the corner cell had
+    corner = var_array[0][0]
+    old = corner.get_assigned_value()
+    c = cspbase.Constraint("NotOld", [corner])
+    c.add_satisfying_tuples([(val,) for val in corner.domain() if val != old])
+    csp.add_constraint(c)
+    btracker = cspbase.BT(csp)
+    status = btracker.bt_search(counting_prop, soln_propagators.ord_mrv)
+    if len(roots) != 2 or (status and (corner.get_assigned_value() == old or
+                                       not check_futoshiki_solution(board, var_array))):
+        details = "Failed while testing the root cache (%s): cached root state used after adding a constraint" % name
+        return 0, details, 1
+    return 1, "", 1
+
+def hint_test(model, name=""):
+    # A board hinted with the solution of a near-duplicate (by variable
+    # name) must be solved without backtracking; a wrong hint must not
+    # change the answer, and phase saving must warm-start the next search.
+    board = BOARD_ONE_GIVEN
+    csp, var_array = model(board)
+    btracker = cspbase.BT(csp)
+    btracker.bt_search(soln_propagators.prop_FC, soln_propagators.ord_mrv)
+    solution = dict((v.name, v.get_assigned_value()) for v in csp.get_all_vars())
+
+    variant = [row[:] for row in board]
+    variant[1][4] = 0
+    csp, var_array = model(variant)
+    btracker = cspbase.BT(csp)
+    status = btracker.bt_search(soln_propagators.prop_FC, soln_propagators.ord_mrv, hint=solution)
+    if not status or not check_futoshiki_solution(variant, var_array) \
+       or btracker.nDecisions > len(csp.get_all_vars()):
+        details = "Failed while testing hints (%s): hinted board not solved without backtracking" % name
+        return 0, details, 1
+
+    wrong = dict((v, 1) for v in csp.get_all_vars())
+    status = btracker.bt_search(soln_propagators.prop_FC, soln_propagators.ord_mrv, hint=wrong)
+    if not status or not check_futoshiki_solution(variant, var_array):
+        details = "Failed while testing hints (%s): board not solved with a wrong hint" % name
+        return 0, details, 1
+
+    btracker = cspbase.BT(csp)
+    btracker.phase_saving_on()
+    btracker.bt_search(soln_propagators.prop_FC, soln_propagators.ord_mrv)
+    status = btracker.bt_search(soln_propagators.prop_FC, soln_propagators.ord_mrv)
+    if not status or not check_futoshiki_solution(variant, var_array) \
+       or btracker.nDecisions > len(csp.get_all_vars()):
+        details = "Failed while testing phase saving (%s): second search did not start from the first's solution" % name
+        return 0, details, 1
+    return 1, "", 1
+
+def session_test(model, name=""):
+    # Add, remove and replace givens and inequalities one at a time: after
+    # each edit the session must agree with a model built afresh from the
+    # edited board. An unknown inequality symbol leaves the board as it is.
+    import futoshiki_csp
+    board = [row[:] for row in BOARD_ONE_GIVEN]
+    build = getattr(futoshiki_csp, "futoshiki_csp_model_%d" % model)
+    session = futoshiki_csp.FutoshikiSession(board, model)
+    edits = [('given', 0, 0, 1), ('given', 0, 0, 2), ('ineq', 2, 0, '<'), ('ineq', 2, 0, '>'),
+             ('given', 3, 3, 2), ('ineq', 0, 0, '.'), ('ineq', 1, 1, 'x'), ('given', 0, 0, 0),
+             ('given', 1, 0, 2), ('given', 1, 0, 0), ('ineq', 3, 2, '<'), ('given', 3, 3, 0)]
+    for kind, row, col, value in edits:
+        with contextlib.redirect_stdout(io.StringIO()):
+            if kind == 'given':
+                session.set_given(row, col, value)
+            else:
+                session.set_inequality(row, col, value)
+        if kind == 'given':
+            board[row][2 * col] = value
+        elif value in ('<', '>', '.'):
+            board[row][2 * col + 1] = value
+        csp, var_array = build(board)
+        btracker = cspbase.BT(csp)
+        expected = btracker.count_solutions(soln_propagators.prop_GAC)
+        solved = session.solve() is not None
+        if session.board() != board or solved != (expected > 0) or \
+           (solved and not check_futoshiki_solution(board, session.var_array)):
+            details = "Failed while testing sessions (%s): wrong solution after %s" % (
+                name, (kind, row, col, value))
+            return 0, details, 1
+        count = session.count_solutions(None)
+        if count != expected:
+            details = "Failed while testing sessions (%s): %d solutions after %s, expected %d" % (
+                name, count, (kind, row, col, value), expected)
+            return 0, details, 1
+    return 1, "", 1
+
+def generator_test(model, name=""):
+    # A generated board must be in the models' grid format, agree with the
+    # Latin square it was made from (the first one a generator with the
+    # same seed samples) and have exactly one solution; a sampled board
+    # (given_rate set) only has to be solvable.
+    import futoshiki_csp
+    import futoshiki_generator
+    n = 5
+    for model_number, given_rate in ((1, None), (2, None), (1, 0.15)):
+        gen = futoshiki_generator.FutoshikiGenerator(n, model_number, seed=7)
+        board = gen.generate() if given_rate is None else gen.sample(given_rate)
+        square = futoshiki_generator.FutoshikiGenerator(n, model_number, seed=7).latin_square()
+        if len(board) != n or any(len(row) != 2 * n - 1 for row in board) or \
+           any(not (isinstance(x, int) and 0 <= x <= n if j % 2 == 0 else x in ('<', '>', '.'))
+               for row in board for j, x in enumerate(row)):
+            details = "Failed while testing the generator (%s): board %s not in grid format" % (name, board)
+            return 0, details, 1
+        for i in range(n):
+            for j in range(n):
+                given = board[i][2 * j]
+                ineq = board[i][2 * j + 1] if j < n - 1 else '.'
+                if (given != 0 and given != square[i][j]) or \
+                   (ineq == '<' and not square[i][j] < square[i][j + 1]) or \
+                   (ineq == '>' and not square[i][j] > square[i][j + 1]):
+                    details = "Failed while testing the generator (%s): board %s does not match square %s" % (
+                        name, board, square)
+                    return 0, details, 1
+        csp, var_array = model(board)
+        if not cspbase.BT(csp).count_solutions(soln_propagators.prop_GAC, limit=1):
+            details = "Failed while testing the generator (%s): model finds no solution of %s" % (name, board)
+            return 0, details, 1
+        if given_rate is None and gen._count(futoshiki_csp.FutoshikiSession(board, model_number)) != 1:
+            details = "Failed while testing the generator (%s): board %s has no unique solution" % (name, board)
+            return 0, details, 1
+    return 1, "", 1
+
+def async_search_test(model, name=""):
+    # A search cancelled while it waits for its executor thread must stop
+    # as soon as it starts; a running one must yield progress snapshots.
+    import asyncio
+    import concurrent.futures
+    import threading
+    import csp_async
+    # unsolvable board: GAC+MRV needs thousands of assignments, plain
+    # backtracking far more
+    board = [[0, '.', 6, '.', 0, '>', 0, '.', 0, '.', 0], [0, '.', 0, '>', 0, '<', 0, '<', 4, '.', 0],
+             [0, '.', 0, '.', 0, '>', 5, '.', 0, '.', 0], [0, '>', 0, '.', 0, '>', 0, '>', 0, '<', 0],
+             [0, '>', 0, '.', 0, '.', 0, '<', 0, '<', 0], [0, '.', 0, '.', 0, '.', 0, '.', 6, '.', 0]]
+
+    async def run():
+        executor = concurrent.futures.ThreadPoolExecutor(1)
+        busy = threading.Event()
+        executor.submit(busy.wait)
+        csp, var_array = model(board)
+        search = csp_async.AsyncSearch(csp, soln_propagators.prop_BT, None, None, executor)
+        search.cancel()
+        busy.set()
+        status = await search.result()
+        if status is not None or search.solver.nDecisions > 1 or \
+           any(v.is_assigned() or v.cur_domain() != v.domain() for v in csp.get_all_vars()):
+            return "search cancelled before it started was not stopped (%d assignments)" % (
+                search.solver.nDecisions)
+
+        csp, var_array = model(board)
+        search = csp_async.AsyncSearch(csp, soln_propagators.prop_FC, soln_propagators.ord_mrv, None, executor)
+        snapshots = [snapshot async for snapshot in search.progress(0.01)]
+        status = await search.result()
+        if status != False or len(snapshots) < 2 or snapshots[-1]['nodes'] != search.solver.nDecisions:
+            return "progress gave %d snapshots and the search returned %s" % (len(snapshots), status)
+        executor.shutdown()
+        return None
+
+    error = asyncio.run(run())
+    if error is not None:
+        details = "Failed while testing async search (%s): %s" % (name, error)
+        return 0, details, 1
+    return 1, "", 1
+
+#######################################
+# ISOLATED TEST RUNNER
+#######################################
+def _run_isolated(conn, test_func, test_arg, test_name):
+    """Worker process body: run one test with its output captured and send
+    the result, CPU time and peak RSS back over conn."""
+    output = io.StringIO()
+    cpu = time.process_time()
+    try:
+        with contextlib.redirect_stdout(output):
+            s, detail, ms = test_func(test_arg)
+    except Exception:
+        tb = traceback.format_exc()
+        s, detail, ms = 0, f"{test_name} - RUNTIME ERROR:\n{tb}", 1
+    conn.send({"score": s, "details": detail, "max_score": ms,
+               "output": output.getvalue(),
+               "cpu": time.process_time() - cpu,
+               "rss": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0})
+    conn.close()
+
+def run_tests(tests, jobs, timeout):
+    """Run each test of tests in its own process, at most jobs at a time.
+    A test still running after timeout seconds is killed. Returns one
+    result dict per test (score, details, max_score, output, wall, cpu,
+    rss), in the order of tests."""
+    results = [None] * len(tests)
+    waiting = list(range(len(tests)))
+    running = dict()    # process sentinel --> [index, process, conn, start time, result]
+    while waiting or running:
+        while waiting and len(running) < max(1, jobs):
+            k = waiting.pop(0)
+            test_func, test_arg, test_name = tests[k]
+            recv_end, send_end = multiprocessing.Pipe(duplex=False)
+            proc = multiprocessing.Process(target=_run_isolated,
+                                           args=(send_end, test_func, test_arg, test_name))
+            proc.start()
+            send_end.close()
+            running[proc.sentinel] = [k, proc, recv_end, time.perf_counter(), None]
+
+        # Wait for a result to arrive, a process to finish or the earliest
+        # deadline. Results are read as soon as they are sent: a large one
+        # (lots of captured output) fills the pipe and blocks the worker
+        # until it is read.
+        now = time.perf_counter()
+        first_deadline = min(entry[3] + timeout for entry in running.values())
+        unread = [entry[2] for entry in running.values() if not entry[2].closed]
+        ready = multiprocessing.connection.wait(list(running) + unread, max(0, first_deadline - now))
+
+        now = time.perf_counter()
+        for sentinel in list(running):
+            entry = running[sentinel]
+            k, proc, conn, start, result = entry
+            test_name = tests[k][2]
+            if not conn.closed and (conn in ready or sentinel in ready) and conn.poll():
+                try:
+                    result = entry[4] = conn.recv()
+                except EOFError:
+                    pass
+                # one message per worker: nothing more to read
+                conn.close()
+            if sentinel in ready:
+                if result is None:
+                    result = {"score": 0, "max_score": 1, "output": "", "cpu": None, "rss": None,
+                              "details": f"{test_name} - CRASHED (exit code {proc.exitcode})"}
+            elif now - start >= timeout:
+                proc.kill()
+                if result is None:
+                    result = {"score": 0, "max_score": 1, "output": "", "cpu": None, "rss": None,
+                              "details": f"{test_name} - TIMEOUT"}
+            else:
+                continue
+            proc.join()
+            if not conn.closed:
+                conn.close()
+            result["wall"] = now - start
+            results[k] = result
+            del running[sentinel]
+    return results
+
+def print_timing_table(tests, results):
+    def fmt(value, pattern):
+        return "-" if value is None else pattern % value
+
+    width = max([len("test")] + [len(t[2]) for t in tests])
+    print()
+    print("%-*s %9s %9s %10s" % (width, "test", "wall (s)", "cpu (s)", "peak RSS"))
+    for (test_func, test_arg, test_name), r in zip(tests, results):
+        print("%-*s %9.3f %9s %10s" % (width, test_name, r["wall"],
+                                       fmt(r["cpu"], "%.3f"), fmt(r["rss"], "%.1f MB")))
+    print()
+
+
 #######################################
 # MAIN FUNCTION
 #######################################
@@ -131,6 +834,10 @@ def main():
     parser.add_argument("--test", "-t", nargs="+",
                         help="Specify one or more test names to run (e.g. test_simple_fc test_tiny_adder_fc). "
                              "If omitted, all tests will be run.")
+    parser.add_argument("--jobs", "-j", type=int, default=os.cpu_count(),
+                        help="Number of tests to run at once (default: CPU count)")
+    parser.add_argument("--timeout", type=float, default=TIMEOUT,
+                        help="Seconds before a test's process is killed (default: %d)" % TIMEOUT)
     args = parser.parse_args()
     verbose = args.verbose
 
@@ -148,26 +855,35 @@ def main():
     except ImportError:
         student_models = None
         
-    # Helper function: run an individual test.
-    # If verbose is not set, redirect output (stdout) to an in-memory buffer.
-    def run_test(test_func, *test_args, test_name=""):
-        try:
-            with contextlib.redirect_stdout(io.StringIO()) if not verbose else contextlib.nullcontext():
-                set_timeout(TIMEOUT)  # 10s timeout per test
-                s, detail, ms = test_func(*test_args)
-                reset_timeout()
-            return s, detail, ms
-        except TimeoutException:
-            return 0, f"{test_name} - TIMEOUT", 1
-        except Exception:
-            tb = traceback.format_exc()
-            return 0, f"{test_name} - RUNTIME ERROR:\n{tb}", 1
-
     # List of tests including an extra field for the test group
     tests = [
         (example_csp_test, student_propagators.prop_BT, "example_csp_test"),
+        (sac_test, student_propagators.prop_GAC, "sac_test"),
+        (branch_and_bound_test, student_propagators.prop_FC, "branch_and_bound_test"),
+        (decompose_test, student_propagators.prop_FC, "decompose_test"),
+        (lcv_test, student_propagators.prop_FC, "lcv_test"),
         # Add more tests here
     ]
+    if student_models is not None:
+        tests += [
+            (futoshiki_model_test, student_models.futoshiki_csp_model_1, "futoshiki_model_1_test"),
+            (futoshiki_model_test, student_models.futoshiki_csp_model_2, "futoshiki_model_2_test"),
+            (futoshiki_propagator_test, student_models.futoshiki_csp_model_1, "futoshiki_propagator_test"),
+            (count_solutions_test, student_models.futoshiki_csp_model_1, "count_solutions_test"),
+            (checkpoint_test, student_models.futoshiki_csp_model_1, "checkpoint_test"),
+            (compile_test, student_models.futoshiki_csp_model_2, "compile_test"),
+            (batch_test, student_models.futoshiki_csp_model_1, "batch_test"),
+            (memory_report_test, student_models.futoshiki_csp_model_2, "memory_report_test"),
+            (min_conflicts_test, student_models.futoshiki_csp_model_1, "min_conflicts_test"),
+            (adaptive_propagator_test, student_models.futoshiki_csp_model_1, "adaptive_propagator_test"),
+            (variable_ordering_test, student_models.futoshiki_csp_model_1, "variable_ordering_test"),
+            (root_cache_test, student_models.futoshiki_csp_model_1, "root_cache_test"),
+            (hint_test, student_models.futoshiki_csp_model_1, "hint_test"),
+            (async_search_test, student_models.futoshiki_csp_model_1, "async_search_test"),
+            (session_test, 1, "session_model_1_test"),
+            (session_test, 2, "session_model_2_test"),
+            (generator_test, student_models.futoshiki_csp_model_1, "generator_test"),
+        ]
 
     # If the user provided specific test names, filter out tests not matching those names.
     if args.test:
@@ -177,16 +893,18 @@ def main():
             print("No matching tests found for the provided names. Exiting.")
             return
 
-    # Initialize dictionaries to track scores per group.
+    # Run the tests in worker processes and print the results in list order.
+    results = run_tests(tests, args.jobs, args.timeout)
     overall_score = 0
     overall_max = 0
-
-    # Run each test, and print a formatted result.
-    for test_func, test_arg, test_name in tests:
-        s, detail, ms = run_test(test_func, test_arg, test_name=test_name)
+    for (test_func, test_arg, test_name), r in zip(tests, results):
+        s, detail, ms = r["score"], r["details"], r["max_score"]
         overall_score += s
         overall_max += ms
 
+        if verbose and r["output"]:
+            print(r["output"], end="")
+
         # Determine status tag based on score
         if s == ms:
             status = "[PASSED]"
@@ -201,6 +919,7 @@ def main():
         # Print the test result in the desired format.
         print(f"{status} {test_name} => score: {s}/{ms} details: {detail_to_print}")
 
+    print_timing_table(tests, results)
     print("Overall Test Score: %d/%d" % (overall_score, overall_max))
 
 
@@ -0,0 +1,85 @@
+'''asyncio front end for bt_search.
+
+   bt_search blocks and only returns when the search is over. The
+   routines here run it in an executor thread so an event loop can run
+   many solves at once, watch their progress and cancel them.
+
+   status = await solve_async(csp, prop_GAC, ord_mrv)
+
+   search = AsyncSearch(csp, prop_GAC, ord_mrv)
+   async for snapshot in search.progress(interval=0.5):
+       print(snapshot['nodes'], snapshot['depth'], snapshot['elapsed'])
+   status = await search.result()
+
+   Cancelling the task awaiting result() (or calling search.cancel())
+   asks the search to stop at its next decision; the search then
+   restores the variable domains before its thread finishes.
+
+   As with BT, every concurrent search needs its own CSP object, since
+   the search assigns and prunes the CSP's variables.
+'''
+
+import asyncio
+
+from cspbase import *
+
+PROGRESS_INTERVAL = 0.5     #default seconds between progress snapshots
+
+class AsyncSearch:
+    '''A bt_search running in an executor, started on creation. Must be
+       created while an event loop is running.'''
+
+    def __init__(self, csp, propagator, var_ord=None, val_ord=None, executor=None):
+        '''executor == concurrent.futures executor to run the search in
+           (None uses the event loop's default thread pool)'''
+        self.solver = BT(csp)
+        self.solver.quiet_on()
+        loop = asyncio.get_running_loop()
+        self.future = loop.run_in_executor(executor, self.solver.bt_search,
+                                           propagator, var_ord, val_ord)
+
+    def done(self):
+        '''return True once the search has finished'''
+        return self.future.done()
+
+    def cancel(self):
+        '''Ask the search to stop; result() will then return None. If the
+           search is still waiting for its executor it stops as soon as
+           it starts.'''
+        self.solver.request_stop()
+
+    def snapshot(self):
+        '''return the current search statistics (nodes, prunings, depth,
+           elapsed seconds)'''
+        return self.solver.progress()
+
+    async def progress(self, interval=PROGRESS_INTERVAL):
+        '''Async iterator yielding a snapshot every interval seconds while
+           the search runs, and a final one when it finishes'''
+        while not self.future.done():
+            try:
+                await asyncio.wait_for(asyncio.shield(self.future), interval)
+            except asyncio.TimeoutError:
+                yield self.snapshot()
+            except Exception:
+                #errors in the search are reported by result()
+                break
+        yield self.snapshot()
+
+    async def result(self):
+        '''Wait for the search and return its status: True (solved, the
+           variables hold the solution), False (no solution) or None
+           (stopped). If the waiting task is cancelled the search is
+           stopped before the cancellation is passed on.'''
+        try:
+            return await asyncio.shield(self.future)
+        except asyncio.CancelledError:
+            self.cancel()
+            #let the search unwind so the CSP is left in a clean state
+            await asyncio.wait([self.future])
+            raise
+
+async def solve_async(csp, propagator, var_ord=None, val_ord=None, executor=None):
+    '''Run bt_search on csp without blocking the event loop. Returns
+       True/False like bt_search, or None if cancelled.'''
+    return await AsyncSearch(csp, propagator, var_ord, val_ord, executor).result()
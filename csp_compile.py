@@ -0,0 +1,264 @@
+'''Compiled on-disk format for CSP objects.
+
+   save_csp(csp, path, var_array=None)
+       writes the variables, domains, constraint scopes and tuple tables
+       of a CSP to a single file. Tables shared by several constraints
+       (see cspbase.Table) are written once.
+
+   load_csp(path)
+       ==> returns (CSP, var_array)
+
+       maps the file into memory and rebuilds the CSP. The tuple tables
+       are NOT copied into Python objects: each constraint gets a
+       MappedTable that reads its tuples straight out of the mapped
+       file. Worker processes loading the same file therefore start
+       without rebuilding any tables and share the pages holding them.
+
+   File layout
+       8 bytes   magic b'CSPC0001'
+       8 bytes   length of the JSON header (little-endian unsigned)
+       header    JSON with the CSP name, the list of distinct domain
+                 values, the variables, the constraints (name, scope,
+                 table and the events they subscribe to) and, for each
+                 table, its arity, number of tuples and the byte offsets
+                 of its arrays
+       arrays    flat native int32 arrays, 4-byte aligned
+
+   Domain values are stored once in the header and referred to
+   everywhere else by their code (index into that list), so domain
+   values must be JSON serializable (e.g., the integers of a Futoshiki
+   board).
+
+   For each table the arrays are
+       rows      ntuples * arity codes, rows sorted so that a tuple can
+                 be looked up with a binary search
+       sup_off   arity * nvalues + 1 offsets into sup_rows; the rows
+                 supporting code v in position i are
+                 sup_rows[sup_off[i*nvalues+v]:sup_off[i*nvalues+v+1]]
+       sup_rows  row numbers
+'''
+
+import array
+import json
+import mmap
+import struct
+
+from cspbase import *
+
+MAGIC = b'CSPC0001'
+
+class MappedTable:
+    '''Read only table of satisfying tuples backed by int32 arrays
+       (normally memoryviews into a memory mapped file). Offers the same
+       interface as cspbase.Table so it can be set on a Constraint.'''
+
+    def __init__(self, arity, values, rows, sup_off, sup_rows):
+        self.arity = arity
+        self.values = values            #code --> domain value
+        self.codes = dict((v, i) for i, v in enumerate(values))
+        self.rows = rows
+        self.sup_off = sup_off
+        self.sup_rows = sup_rows
+        self.ntuples = len(rows) // arity if arity else 0
+
+    def row(self, k):
+        '''return the k-th tuple of the table as a tuple of codes'''
+        return tuple(self.rows[k*self.arity:(k+1)*self.arity])
+
+    def check(self, t):
+        '''return true if tuple t is in the table (binary search)'''
+        codes = []
+        for val in t:
+            if not val in self.codes:
+                return False
+            codes.append(self.codes[val])
+        codes = tuple(codes)
+        lo, hi = 0, self.ntuples
+        while lo < hi:
+            mid = (lo + hi) // 2
+            r = self.row(mid)
+            if r < codes:
+                lo = mid + 1
+            elif r > codes:
+                hi = mid
+            else:
+                return True
+        return False
+
+    def supports(self, i, val):
+        '''return an iterator over the tuples having value val in position
+           i. Each tuple is decoded only when the iterator reaches it, so a
+           caller stopping at the first valid support (Constraint.has_support)
+           decodes no more rows than it looks at (has_valid_support, used
+           by Constraint.has_support, decodes none).'''
+        code = self.codes.get(val)
+        if code is None:
+            return iter(())
+        k = i * len(self.values) + code
+        start, end = self.sup_off[k], self.sup_off[k+1]
+        decode = self.values.__getitem__
+        rows = self.rows
+        arity = self.arity
+        return (tuple(map(decode, rows[r*arity:(r+1)*arity]))
+                for r in self.sup_rows[start:end])
+
+    def has_valid_support(self, i, val, scope):
+        '''return true if some tuple with value val in position i has each
+           of its values in the current domain of the variable of scope in
+           the same position. Works on the codes in the mapped rows,
+           decoding a value only to check it and building no tuples.'''
+        code = self.codes.get(val)
+        if code is None:
+            return False
+        k = i * len(self.values) + code
+        values = self.values
+        rows = self.rows
+        arity = self.arity
+        for r in self.sup_rows[self.sup_off[k]:self.sup_off[k+1]]:
+            base = r * arity
+            for j in range(arity):
+                if not scope[j].in_cur_domain(values[rows[base + j]]):
+                    break
+            else:
+                return True
+        return False
+
+    def copy(self):
+        '''return an ordinary (unshared, in memory) Table with the same tuples'''
+        t = Table(self.arity)
+        t.add_tuples(self)
+        return t
+
+    def __iter__(self):
+        for k in range(self.ntuples):
+            yield tuple(self.values[c] for c in self.row(k))
+
+    def __len__(self):
+        return self.ntuples
+
+    def memory_size(self):
+        '''Number of bytes of the table; they live in the mapped file and
+           are shared with other processes mapping it'''
+        return self.rows.nbytes + self.sup_off.nbytes + self.sup_rows.nbytes
+
+def save_csp(csp, path, var_array=None):
+    '''Write csp (and optionally the var_array returned with it by a
+       model) to path in the compiled format'''
+
+    #Give every distinct domain value a code
+    values = []
+    codes = dict()
+    for var in csp.get_all_vars():
+        for val in var.domain():
+            if not val in codes:
+                codes[val] = len(values)
+                values.append(val)
+
+    var_index = dict((var, i) for i, var in enumerate(csp.get_all_vars()))
+
+    #Write each table object once, no matter how many constraints use it
+    tables = []
+    table_index = dict()
+    cons = []
+    for c in csp.get_all_cons():
+        if not id(c.table) in table_index:
+            table_index[id(c.table)] = len(tables)
+            tables.append(c.table)
+        cons.append([c.name, [var_index[v] for v in c.get_scope()],
+                     table_index[id(c.table)], c.events])
+
+    nvalues = len(values)
+    blobs = []
+    table_info = []
+    offset = 0
+    for table in tables:
+        rows = []
+        for t in table:
+            if all(val in codes for val in t):
+                rows.append(tuple(codes[val] for val in t))
+        rows.sort()
+
+        sup = [[] for k in range(table.arity * nvalues)]
+        for r, t in enumerate(rows):
+            for i, c in enumerate(t):
+                sup[i*nvalues + c].append(r)
+        sup_off = [0]
+        sup_rows = []
+        for lst in sup:
+            sup_rows.extend(lst)
+            sup_off.append(len(sup_rows))
+
+        info = [table.arity, len(rows)]
+        for data in ([c for t in rows for c in t], sup_off, sup_rows):
+            a = array.array('i', data)
+            info.append(offset)
+            blobs.append(a)
+            offset += len(a) * a.itemsize
+        table_info.append(info)
+
+    header = {
+        'name': csp.name,
+        'values': values,
+        'vars': [[v.name, [codes[val] for val in v.domain()]]
+                 for v in csp.get_all_vars()],
+        'cons': cons,
+        'tables': table_info,
+        'var_array': None if var_array is None else
+                     [[var_index[v] for v in row] for row in var_array],
+    }
+    hdr = json.dumps(header).encode('utf-8')
+    #pad so the arrays start 4-byte aligned
+    hdr += b' ' * (-(len(MAGIC) + 8 + len(hdr)) % 4)
+
+    with open(path, 'wb') as f:
+        f.write(MAGIC)
+        f.write(struct.pack('<Q', len(hdr)))
+        f.write(hdr)
+        for a in blobs:
+            a.tofile(f)
+
+def load_csp(path):
+    '''Memory map a compiled CSP file and rebuild the CSP from it.
+       Returns (csp, var_array); var_array is None if it was not saved.'''
+
+    with open(path, 'rb') as f:
+        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    if mm[:len(MAGIC)] != MAGIC:
+        print("Trying to load", path, "which is not a compiled CSP file")
+        return None, None
+    (hlen,) = struct.unpack('<Q', mm[len(MAGIC):len(MAGIC)+8])
+    base = len(MAGIC) + 8 + hlen
+    header = json.loads(bytes(mm[len(MAGIC)+8:base]).decode('utf-8'))
+
+    values = header['values']
+    nvalues = len(values)
+    buf = memoryview(mm)
+
+    def int_array(start, count):
+        return buf[base+start:base+start+4*count].cast('i')
+
+    tables = []
+    for arity, ntuples, rows_at, off_at, sup_at in header['tables']:
+        sup_off = int_array(off_at, arity*nvalues + 1)
+        tables.append(MappedTable(arity, values,
+                                  int_array(rows_at, ntuples*arity),
+                                  sup_off,
+                                  int_array(sup_at, sup_off[-1])))
+
+    vars = [Variable(name, [values[c] for c in dom])
+            for name, dom in header['vars']]
+    csp = CSP(header['name'], vars)
+    for entry in header['cons']:
+        name, scope, t = entry[:3]
+        c = Constraint(name, [vars[i] for i in scope])
+        c.set_table(tables[t])
+        if len(entry) > 3:
+            #files written before events were saved keep the default
+            c.subscribe(entry[3])
+        csp.add_constraint(c)
+
+    var_array = None
+    if header['var_array'] is not None:
+        var_array = [[vars[i] for i in row] for row in header['var_array']]
+    return csp, var_array
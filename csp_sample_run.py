@@ -109,3 +109,6 @@ print("=======================================================")
 print("GAC 8-queens")
 solve_nQueens(8, 'GAC', trace)
 
+print("=======================================================")
+print("Min-conflicts local search on 30-queens")
+MinConflicts(nQueens(30), seed=0).mc_search()
@@ -1,4 +1,10 @@
+import sys
+import os
+import json
+import random
 import time
+import array
+import itertools
 import functools
 
 '''Constraint Satisfaction Routines
@@ -30,12 +36,46 @@ import functools
       for each variable in the constraint (in the same ORDER as the
       variables of the constraint were specified).
 
+      The satisfying tuples are held in a Table. Constraints imposing
+      the same relation can share one Table instead of each building
+      their own copy.
+
     C) Backtracking routine---takes propagator and CSP as arguments
        so that basic backtracking, forward-checking or GAC can be 
        executed depending on the propagator used.
 
+    D) Min-conflicts local search---for large CSPs with many solutions
+       (e.g. n-Queens with large n) where backtracking is hopeless.
+
 '''
 
+#Domain change events. Propagators report which of these happened to a
+#variable so only constraints interested in that kind of change are
+#revised (see Constraint.subscribe).
+EVT_VALUE = 1   #a value was removed from the current domain
+EVT_BOUND = 2   #the first or last value of the current domain was removed
+EVT_FIX = 4     #the current domain was reduced to a single value
+EVT_ALL = EVT_VALUE | EVT_BOUND | EVT_FIX
+
+#Cost classes of constraints, cheapest first. Propagators revise pending
+#constraints of cheaper classes first (see Constraint.cost_class).
+COST_UNARY = 0
+COST_BINARY = 1
+COST_TABLE = 2      #n-ary table constraint
+COST_GLOBAL = 3     #constraint with its own (expensive) propagation
+N_COST_CLASSES = 4
+
+#Default seconds between search checkpoints (see BT.checkpoint_on)
+CHECKPOINT_INTERVAL = 60.0
+
+#Most root propagation results a CSP keeps (see CSP.get_root_state)
+ROOT_CACHE_SIZE = 8
+
+#Defaults of MinConflicts.mc_search
+MC_MAX_STEPS = 100000   #moves before giving up
+MC_TABU_TENURE = 10     #moves a variable may not return to a value it left
+MC_WALK_PROB = 0.02     #probability of moving to a random value
+
 class Variable: 
 
     '''Class for defining CSP variables.  On initialization the
@@ -72,6 +112,8 @@ class Variable:
            flags are not changed so that pruning and unpruning can
            work independently of assignment and unassignment. 
            '''
+    __slots__ = ('name', 'dom', 'curdom', 'assignedValue', 'stamp', 'cons_pos')
+
     #
     #set up and info methods
     #
@@ -80,17 +122,25 @@ class Variable:
         string). Optionally specify the initial domain.
         '''
         self.name = name                #text name for variable
-        self.dom = list(domain)         #Make a copy of passed domain
-        self.curdom = [True] * len(domain)      #using list
+        self.dom = tuple(domain)        #Immutable, so a tuple passed in is shared rather than copied
+        self.curdom = bytearray(b'\x01') * len(self.dom)  #one byte flag per value
         #for bt_search
         self.assignedValue = None
+        #incremented on every change to the current domain or assignment,
+        #so cached information about the variable can be checked for staleness
+        self.stamp = 0
+        #(constraint, position) for every constraint of a CSP (see
+        #Constraint.attach) whose scope the variable is in, so
+        #assign/unassign can keep the constraints' counters current
+        self.cons_pos = []
 
     def add_domain_values(self, values):
         '''Add additional domain values to the domain
            Removals not supported removals'''
-        for val in values: 
-            self.dom.append(val)
-            self.curdom.append(True)
+        values = tuple(values)
+        self.dom = self.dom + values
+        self.curdom.extend(b'\x01' * len(values))
+        self.stamp += 1
 
     def domain_size(self):
         '''Return the size of the (permanent) domain'''
@@ -107,10 +157,12 @@ class Variable:
     def prune_value(self, value):
         '''Remove value from CURRENT domain'''
         self.curdom[self.value_index(value)] = False
+        self.stamp += 1
 
     def unprune_value(self, value):
         '''Restore value to CURRENT domain'''
         self.curdom[self.value_index(value)] = True
+        self.stamp += 1
 
     def cur_domain(self):
         '''return list of values in CURRENT domain (if assigned 
@@ -140,12 +192,12 @@ class Variable:
         if self.is_assigned():
             return 1
         else:
-            return(sum(1 for v in self.curdom if v))
+            return self.curdom.count(1)
 
     def restore_curdom(self):
         '''return all values back into CURRENT domain'''
-        for i in range(len(self.curdom)):
-            self.curdom[i] = True
+        self.curdom[:] = b'\x01' * len(self.curdom)
+        self.stamp += 1
 
     #
     #methods for assigning and unassigning
@@ -165,6 +217,10 @@ class Variable:
             return
 
         self.assignedValue = value
+        self.stamp += 1
+        for c, i in self.cons_pos:
+            c.n_unasgn -= 1
+            c.unasgn_pos_sum -= i
 
     def unassign(self):
         '''Used by bt_search. Unassign and restore old curdom'''
@@ -172,6 +228,10 @@ class Variable:
             print("ERROR: trying to unassign variable", self, " not yet assigned")
             return
         self.assignedValue = None
+        self.stamp += 1
+        for c, i in self.cons_pos:
+            c.n_unasgn += 1
+            c.unasgn_pos_sum += i
 
     def get_assigned_value(self):
         '''return assigned value...returns None if is unassigned'''
@@ -195,14 +255,125 @@ class Variable:
     def print_all(self):
         '''Also print the variable domain and current domain'''
         print("Var--\"{}\": Dom = {}, CurDom = {}".format(self.name, 
-                                                             self.dom, 
-                                                             self.curdom))
+                                                             list(self.dom), 
+                                                             [bool(f) for f in self.curdom]))
+class Table:
+    '''Class for holding a table of satisfying tuples (a relation).
+
+       A table is defined over argument POSITIONS rather than over
+       particular variable objects, so the same table can be shared by
+       every constraint that imposes the same relation (e.g., all of
+       the binary not-equal constraints of a Futoshiki board). A
+       constraint maps its scope onto the positions of its table.
+
+       Once a table is shared it should not be modified; Constraint
+       copies a shared table before adding tuples to it.'''
+
+    __slots__ = ('arity', 'rows', 'sat_tuples', 'sup_tuples')
+
+    def __init__(self, arity):
+        '''create an empty table for tuples of length arity'''
+        self.arity = arity
+        #each tuple is stored once, in 'rows'; the other structures refer
+        #to it by identity (sat_tuples) or by row number (sup_tuples)
+        self.rows = []
+        self.sat_tuples = set()
+
+        #'sup_tuples[i][val]' is an array of the numbers of the rows that
+        #have value val in position i. Used to help support GAC.
+        self.sup_tuples = [dict() for i in range(arity)]
+
+    def add_tuples(self, tuples, chunk_size=None):
+        '''Add satisfying tuples to the table. tuples can be any iterable
+           (a list, a generator, ...) of sequences of values; it is read
+           once, front to back, and never copied as a whole.
+
+           If chunk_size is given the tuples are read chunk_size at a time,
+           and the row numbers of each chunk are added to the support index
+           in bulk. Nothing but the table and the current chunk is held.
+           Without chunk_size all the tuples form a single chunk.'''
+        tuples = iter(tuples)
+        while True:
+            if chunk_size is None:
+                chunk = tuples
+            else:
+                chunk = list(itertools.islice(tuples, chunk_size))
+                if not chunk:
+                    return
+            first = len(self.rows)
+            for x in chunk:
+                t = tuple(x)  #ensure we have an immutable tuple (a tuple is not copied)
+                if t in self.sat_tuples:
+                    continue
+                self.sat_tuples.add(t)
+                self.rows.append(t)
+            self._index_rows(first)
+            if chunk_size is None:
+                return
+
+    def _index_rows(self, first):
+        '''put rows first, first+1, ... in as supports for the values in them'''
+        for i in range(self.arity):
+            sup = self.sup_tuples[i]
+            for k in range(first, len(self.rows)):
+                val = self.rows[k][i]
+                if not val in sup:
+                    sup[val] = array.array('I')
+                sup[val].append(k)
+
+    def check(self, t):
+        '''return true if tuple t is in the table'''
+        return t in self.sat_tuples
+
+    def supports(self, i, val):
+        '''return the tuples having value val in position i'''
+        return map(self.rows.__getitem__, self.sup_tuples[i].get(val, ()))
+
+    def has_valid_support(self, i, val, scope):
+        '''return true if some tuple with value val in position i has each
+           of its values in the current domain of the variable of scope in
+           the same position'''
+        for t in self.supports(i, val):
+            for j, var in enumerate(scope):
+                if not var.in_cur_domain(t[j]):
+                    break
+            else:
+                return True
+        return False
+
+    def __iter__(self):
+        return iter(self.rows)
+
+    def copy(self):
+        '''return an unshared copy of the table'''
+        t = Table(self.arity)
+        t.rows = list(self.rows)
+        t.sat_tuples = set(self.sat_tuples)
+        t.sup_tuples = [dict((val, array.array('I', ks)) for val, ks in sup.items())
+                        for sup in self.sup_tuples]
+        return t
+
+    def __len__(self):
+        return len(self.rows)
+
+    def memory_size(self):
+        '''Approximate number of bytes used by the table'''
+        size = sys.getsizeof(self) + sys.getsizeof(self.rows) + sys.getsizeof(self.sat_tuples)
+        size += sum(sys.getsizeof(t) for t in self.rows)
+        size += sys.getsizeof(self.sup_tuples)
+        for sup in self.sup_tuples:
+            size += sys.getsizeof(sup) + sum(sys.getsizeof(ks) for ks in sup.values())
+        return size
+
 class Constraint: 
     '''Class for defining constraints variable objects specifes an
        ordering over variables.  This ordering is used when calling
        the satisfied function which tests if an assignment to the
        variables in the constraint's scope satisfies the constraint'''
 
+    __slots__ = ('name', 'scope', 'table', 'shared_table', 'counts', 'counts_stamp', 'counts_seen',
+                 'events', 'n_unasgn', 'unasgn_pos_sum', 'n_csps', 'weight')
+
     def __init__(self, name, scope): 
         '''create a constraint object, specify the constraint name (a
         string) and its scope (an ORDERED list of variable objects).
@@ -216,32 +387,112 @@ class Constraint:
 
         NOTE: This is a very space expensive representation...a proper
         constraint object would allow for representing the constraint
-        with a function.  
+        with a function. To reduce the cost, constraints imposing the
+        same relation can share a single Table (see set_table).
         '''
 
-        self.scope = list(scope)
+        self.scope = tuple(scope)
         self.name = name
-        self.sat_tuples = dict()
-
-        #The next object data item 'sup_tuples' will be used to help
-        #support GAC propgation. It allows access to a list of 
-        #satisfying tuples that contain a particular variable/value
-        #pair.
-        self.sup_tuples = dict()
-
-    def add_satisfying_tuples(self, tuples):
-        '''We specify the constraint by adding its complete list of satisfying tuples.'''
-        for x in tuples:
-            t = tuple(x)  #ensure we have an immutable tuple
-            if not t in self.sat_tuples:
-                self.sat_tuples[t] = True
-
-            #now put t in as a support for all of the variable values in it
-            for i, val in enumerate(t):
-                var = self.scope[i]
-                if not (var,val) in self.sup_tuples:
-                    self.sup_tuples[(var,val)] = []
-                self.sup_tuples[(var,val)].append(t)
+
+        self.table = Table(len(self.scope))
+        self.shared_table = False
+
+        #domain change events that can remove supports of this constraint
+        self.events = EVT_ALL
+
+        #Number of unassigned variables in the scope and the sum of their
+        #positions. While the constraint is in a CSP (n_csps > 0) they are
+        #kept current by Variable.assign/unassign (see attach); otherwise
+        #they are counted afresh when asked for. When one variable is left
+        #unassigned the sum is its position.
+        self.n_unasgn = 0
+        self.unasgn_pos_sum = 0
+        self.n_csps = 0
+        self.count_unasgn()
+
+        #support counts (see support_counts), None until first asked for,
+        #with the stamp and the values of each scope variable they are
+        #up to date with
+        self.counts = None
+        self.counts_stamp = None
+        self.counts_seen = None
+
+        #number of dead ends this constraint has caused (plus one), bumped
+        #by the propagators; used by weighted degree variable ordering
+        self.weight = 1
+
+    def add_satisfying_tuples(self, tuples, chunk_size=None):
+        '''We specify the constraint by adding its complete list of satisfying tuples.
+           Any iterable of tuples will do, e.g. a generator, so the tuples
+           never need to be built as a list first. Can also be called
+           repeatedly with successive chunks of the tuples. See Table.add_tuples
+           for chunk_size.'''
+        self.counts = None
+        if self.shared_table:
+            #never modify a table other constraints are using
+            self.table = self.table.copy()
+            self.shared_table = False
+        self.table.add_tuples(tuples, chunk_size)
+
+    def set_table(self, table):
+        '''Specify the constraint by a prebuilt (possibly shared) table
+           of satisfying tuples. The table's arity must match the scope.'''
+        if table.arity != len(self.scope):
+            print("Trying to set table of arity", table.arity,
+                  "on constraint", self)
+            return
+        self.counts = None
+        self.table = table
+        self.shared_table = True
+
+    def subscribe(self, events):
+        '''Specify which domain change events (EVT_VALUE, EVT_BOUND,
+           EVT_FIX or'ed together) on the scope variables can cause values
+           to lose their support, so propagators can skip revising the
+           constraint after other changes. E.g., a binary not-equal
+           constraint only needs EVT_FIX, and an inequality over ordered
+           domains only EVT_BOUND. The default is all events.'''
+        self.events = events
+
+    def attach(self):
+        '''Called by CSP.add_constraint: make the scope variables keep the
+           unassigned counters current from now on'''
+        if self.n_csps == 0:
+            self.count_unasgn()
+            for i, var in enumerate(self.scope):
+                var.cons_pos.append((self, i))
+        self.n_csps += 1
+
+    def detach(self):
+        '''Called by CSP.remove_constraint: once the constraint is in no
+           CSP, the scope variables stop updating it (and no longer keep
+           it alive)'''
+        if self.n_csps == 0:
+            return
+        self.n_csps -= 1
+        if self.n_csps == 0:
+            for var in self.scope:
+                var.cons_pos = [(c, i) for c, i in var.cons_pos if c is not self]
+
+    def count_unasgn(self):
+        '''Internal routine. Count the unassigned variables of the scope
+           (and the sum of their positions) by scanning it'''
+        self.n_unasgn = 0
+        self.unasgn_pos_sum = 0
+        for i, var in enumerate(self.scope):
+            if not var.is_assigned():
+                self.n_unasgn += 1
+                self.unasgn_pos_sum += i
+
+    def cost_class(self):
+        '''Return how expensive the constraint is to revise: COST_UNARY,
+           COST_BINARY or COST_TABLE by arity. Constraints with their own
+           global reasoning should return COST_GLOBAL.'''
+        if len(self.scope) <= 1:
+            return COST_UNARY
+        if len(self.scope) == 2:
+            return COST_BINARY
+        return COST_TABLE
 
     def get_scope(self):
         '''get list of variables the constraint is over'''
@@ -254,19 +505,33 @@ class Constraint:
            constraints "satisfies" function.  Note the list of values
            are must be ordered in the same order as the list of
            variables in the constraints scope'''
-        return tuple(vals) in self.sat_tuples
+        return self.table.check(tuple(vals))
 
     def get_n_unasgn(self):
         '''return the number of unassigned variables in the constraint's scope'''
-        n = 0
-        for v in self.scope:
-            if not v.is_assigned():
-                n = n + 1
-        return n
+        if not self.n_csps:
+            self.count_unasgn()
+        return self.n_unasgn
+
+    def get_last_unasgn_var(self):
+        '''return the only unassigned variable in the constraint's scope,
+           or None if there is not exactly one'''
+        if not self.n_csps:
+            self.count_unasgn()
+        if self.n_unasgn != 1:
+            return None
+        return self.scope[self.unasgn_pos_sum]
 
     def get_unasgn_vars(self): 
         '''return list of unassigned variables in constraint's scope. Note
-           more expensive to get the list than to then number'''
+           more expensive to get the list than to then number, unless at
+           most one is left'''
+        if not self.n_csps:
+            self.count_unasgn()
+        if self.n_unasgn == 0:
+            return []
+        if self.n_unasgn == 1:
+            return [self.scope[self.unasgn_pos_sum]]
         vs = []
         for v in self.scope:
             if not v.is_assigned():
@@ -278,11 +543,61 @@ class Constraint:
            of assignments satisfying the constraint where each value is
            still in the corresponding variables current domain
         '''
-        if (var, val) in self.sup_tuples:
-            for t in self.sup_tuples[(var, val)]:
+        #one scan of the (short) scope finds the position, or that var is
+        #not in it; no per-constraint position dict is kept
+        try:
+            i = self.scope.index(var)
+        except ValueError:
+            return False
+        return self.table.has_valid_support(i, val, self.scope)
+
+    def support_counts(self):
+        '''Return, for each position of the scope, a dict mapping each
+           value to the number of valid tuples (see tuple_is_valid)
+           containing it. The counts are computed in one pass over the
+           table the first time. After that they are brought up to date
+           incrementally: for each scope variable that changed (see
+           Variable.stamp), only the tuples with a value it lost or
+           regained since the last call are looked at.'''
+        if self.counts is None:
+            counts = [dict() for var in self.scope]
+            for t in self.table:
                 if self.tuple_is_valid(t):
-                    return True
-        return False
+                    for i, val in enumerate(t):
+                        counts[i][val] = counts[i].get(val, 0) + 1
+            self.counts = counts
+            self.counts_stamp = [var.stamp for var in self.scope]
+            self.counts_seen = [set(var.cur_domain()) for var in self.scope]
+            return self.counts
+
+        for i, var in enumerate(self.scope):
+            if var.stamp == self.counts_stamp[i]:
+                continue
+            self.counts_stamp[i] = var.stamp
+            seen = self.counts_seen[i]
+            now = set(var.cur_domain())
+            for val in seen - now:
+                self.recount(i, val, -1)
+            for val in now - seen:
+                self.recount(i, val, 1)
+            self.counts_seen[i] = now
+        return self.counts
+
+    def recount(self, i, val, delta):
+        '''Internal routine of support_counts. Value val has left
+           (delta=-1) or rejoined (delta=1) the values the variable in
+           position i can take: the tuples with val in position i whose
+           other values the counts take as valid have become invalid (or
+           valid), so update the counts of their values.'''
+        counts = self.counts
+        seen = self.counts_seen
+        for t in self.table.supports(i, val):
+            for j, v in enumerate(t):
+                if j != i and not v in seen[j]:
+                    break
+            else:
+                for j, v in enumerate(t):
+                    counts[j][v] = counts[j].get(v, 0) + delta
 
     def tuple_is_valid(self, t):
         '''Internal routine. Check if every value in tuple is still in
@@ -309,6 +624,18 @@ class CSP:
         self.vars = []
         self.cons = []
         self.vars_to_cons = dict()
+
+        #Watched variables for checking constraints during plain
+        #backtracking: each constraint watches one of its unassigned
+        #variables and only needs looking at when that one is assigned.
+        self.watched = dict()       #constraint --> watched variable
+        self.watchers = dict()      #variable --> constraints watching it
+
+        #Root propagation results, so repeated searches of the CSP can
+        #skip it (see get_root_state). nChanges counts the variables and
+        #constraints added or removed.
+        self.root_cache = dict()    #propagator --> (signature, status, prunings)
+        self.nChanges = 0
         for v in vars:
             self.add_var(v)
 
@@ -322,6 +649,8 @@ class CSP:
         else:
             self.vars.append(v)
             self.vars_to_cons[v] = []
+            self.watchers[v] = []
+            self.nChanges += 1
 
     def add_constraint(self,c):
         '''Add constraint to CSP. Note that all variables in the 
@@ -335,6 +664,99 @@ class CSP:
                     return
                 self.vars_to_cons[v].append(c)
             self.cons.append(c)
+            c.attach()
+            self.set_watch(c)
+            self.nChanges += 1
+
+    def remove_constraint(self,c):
+        '''Remove a constraint previously added to the CSP'''
+        if not c in self.cons:
+            print("Trying to remove constraint ", c, " not in CSP object")
+            return
+        self.cons.remove(c)
+        for v in c.scope:
+            self.vars_to_cons[v].remove(c)
+        c.detach()
+        if c in self.watched:
+            self.watchers[self.watched.pop(c)].remove(c)
+        self.nChanges += 1
+
+    def set_watch(self, c):
+        '''Make constraint c watch one of its unassigned variables.
+           Returns the variable watched, or None if every variable is
+           assigned; the watch is then left where it is (on the variable
+           assigned last, when called from prop_BT) so the constraint is
+           looked at again once that variable is reassigned.'''
+        if not c.scope:
+            return None
+        new = c.get_last_unasgn_var()
+        if new is None and c.get_n_unasgn() > 0:
+            for v in c.scope:
+                if not v.is_assigned():
+                    new = v
+                    break
+        old = self.watched.get(c)
+        if new is None and old is not None:
+            return None
+        watch = new if new is not None else c.scope[0]
+        if old is not watch:
+            if old is not None:
+                self.watchers[old].remove(c)
+            self.watched[c] = watch
+            self.watchers[watch].append(c)
+        return new
+
+    def signature(self):
+        '''Return a value that changes whenever a variable, a domain
+           value or a constraint is added (or a constraint removed, or a
+           constraint's table changed), so the root propagation results
+           cached for the old CSP are never used for the new one'''
+        return (self.nChanges,
+                tuple(len(v.dom) for v in self.vars),
+                tuple((id(c.table), len(c.table)) for c in self.cons))
+
+    def get_root_state(self, propagator):
+        '''If propagator's root propagation (before any assignment, from
+           the full domains) is cached for the CSP as it is now, prune the
+           values it pruned and return (status, prunings) as the
+           propagator would. Otherwise return None.'''
+        entry = self.root_cache.get(propagator)
+        if entry is None or entry[0] != self.signature():
+            return None
+        signature, status, prunings = entry
+        for var, val in prunings:
+            var.prune_value(val)
+        return status, list(prunings)
+
+    def save_root_state(self, propagator, status, prunings):
+        '''Cache the result of propagator's root propagation (see
+           get_root_state). Nothing is kept when it pruned nothing and
+           found no dead end: rerunning it then costs little (and
+           prop_BT sets up its watches there).'''
+        if status and not prunings:
+            return
+        if not propagator in self.root_cache and len(self.root_cache) >= ROOT_CACHE_SIZE:
+            #forget the oldest entry
+            del self.root_cache[next(iter(self.root_cache))]
+        self.root_cache[propagator] = (self.signature(), status, list(prunings))
+
+    def clear_root_cache(self):
+        '''Forget every cached root propagation result'''
+        self.root_cache = dict()
+
+    def reset_weights(self):
+        '''Set the weight of every constraint back to 1 (see Constraint.weight)'''
+        for c in self.cons:
+            c.weight = 1
+
+    def reset_watches(self):
+        '''Choose the watched variable of every constraint afresh'''
+        for c in self.cons:
+            self.set_watch(c)
+
+    def get_cons_watching(self, var):
+        '''return list of constraints currently watching var'''
+        return list(self.watchers[var])
 
     def get_all_cons(self):
         '''return list of all constraints in the CSP'''
@@ -352,6 +774,97 @@ class CSP:
         '''return list of unassigned variables in the CSP'''
         return [v for v in self.vars if not v.is_assigned()]
 
+    def components(self):
+        '''Return the connected components of the constraint graph over
+           the unassigned variables, as a list of lists of variables.
+           Two unassigned variables are connected if some constraint has
+           both in its scope; assigned variables connect nothing. Meant
+           to be called after root propagation (and after assigning the
+           variables propagation has fixed), when the remaining problem
+           often falls apart into independent pieces.'''
+        comps = []
+        seen = set()
+        for v in self.vars:
+            if v.is_assigned() or v in seen:
+                continue
+            comp = [v]
+            seen.add(v)
+            k = 0
+            while k < len(comp):
+                for c in self.vars_to_cons[comp[k]]:
+                    if c.get_n_unasgn() < 2:
+                        continue
+                    for w in c.get_unasgn_vars():
+                        if not w in seen:
+                            seen.add(w)
+                            comp.append(w)
+                k += 1
+            comps.append(comp)
+        return comps
+
+    def sub_csp(self, vars):
+        '''Return a CSP over vars and the constraints involving them
+           (together with the other variables of those constraints'
+           scopes). The variables and constraints are shared, not copied.'''
+        cons = []
+        seen = set()
+        for v in vars:
+            for c in self.vars_to_cons[v]:
+                if not c in seen:
+                    seen.add(c)
+                    cons.append(c)
+        in_vars = set(vars)
+        sub_vars = list(vars)
+        for c in cons:
+            for v in c.scope:
+                if not v in in_vars:
+                    in_vars.add(v)
+                    sub_vars.append(v)
+        sub = CSP(self.name, sub_vars)
+        for c in cons:
+            sub.add_constraint(c)
+            #the constraints stay attached to their variables through self,
+            #so a part that is simply dropped must not keep them attached
+            c.detach()
+        return sub
+
+    def memory_report(self):
+        '''Return the approximate number of bytes used by the CSP as a
+           dict with entries 'variables', 'constraints', 'tables' (each
+           table counted once however many constraints share it),
+           'index' (the CSP's own lists and dicts) and 'total'.'''
+        size = sys.getsizeof
+        report = dict()
+
+        doms = dict()
+        n = 0
+        for v in self.vars:
+            n += size(v) + size(v.curdom) + size(v.cons_pos)
+            n += sum(size(cp) for cp in v.cons_pos)
+            doms[id(v.dom)] = size(v.dom)
+        report['variables'] = n + sum(doms.values())
+
+        tables = dict()
+        n = 0
+        for c in self.cons:
+            n += size(c) + size(c.scope)
+            if c.counts is not None:
+                n += size(c.counts) + size(c.counts_stamp)
+                n += sum(size(d) for d in c.counts)
+            tables[id(c.table)] = c.table
+        report['constraints'] = n
+        report['tables'] = sum(t.memory_size() for t in tables.values())
+
+        n = size(self) + size(self.vars) + size(self.cons)
+        for d in (self.vars_to_cons, self.watched, self.watchers):
+            n += size(d)
+        n += sum(size(cs) for cs in self.vars_to_cons.values())
+        n += sum(size(cs) for cs in self.watchers.values())
+        report['index'] = n
+
+        report['total'] = sum(report.values())
+        return report
+
     def print_all(self):
         print("CSP", self.name)
         print("   Variables = ", self.vars)
@@ -386,7 +899,27 @@ class BT:
         self.nPrunings  = 0 #nPrunings is the number of value prunings during search
         unasgn_vars = list() #used to track unassigned variables
         self.TRACE = False
+        self.QUIET = False  #when True bt_search prints nothing
+        self.ROOT_CACHE = True  #when True bt_search reuses cached root propagation
+        self.PHASE_SAVING = False   #when True backtracking remembers each variable's value
+        self.phase = dict()         #variable --> value bt_recurse tries first
         self.runtime = 0
+        self.depth = 0      #current level of bt_recurse
+        self.start_time = time.perf_counter()
+        self.stop_requested = False #set by request_stop to end the search early
+        self.sub_solver = None      #BT searching the current component (decompose)
+        self.on_solution = None     #called at each solution found, returns True to stop
+                                    #(None: stop at the first solution)
+        self.solutions = []         #solutions found by count_solutions
+        self.best_value = None      #objective value of the best solution (bb_search)
+        self.best_solution = None   #variable --> value of the best solution (bb_search)
+        self.frames = []            #[var, value order, index of value tried] per level
+        self.checkpoint_path = None #file checkpoints are written to (None: off)
+        self.checkpoint_interval = CHECKPOINT_INTERVAL
+        self.next_checkpoint = 0    #perf_counter time of the next checkpoint
+        self.cpu_offset = 0         #CPU time of the search before it was resumed
+        self.cpu_start = time.process_time()
+        self.stop_saved = False     #a checkpoint was saved when the search was stopped
 
     def trace_on(self):
         '''Turn search trace on'''
@@ -396,12 +929,123 @@ class BT:
         '''Turn search trace off'''
         self.TRACE = False
 
+    def quiet_on(self):
+        '''Stop bt_search printing results and statistics'''
+        self.QUIET = True
+
+    def quiet_off(self):
+        '''Let bt_search print results and statistics'''
+        self.QUIET = False
+
+    def phase_saving_on(self):
+        '''Make bt_search remember the last value each variable held when
+           it was unassigned (and the values of the solution found) and try
+           that value first the next time it branches on the variable, in
+           this search and the following ones of this BT'''
+        self.PHASE_SAVING = True
+
+    def phase_saving_off(self):
+        '''Stop remembering values; only hints are tried first'''
+        self.PHASE_SAVING = False
+
+    def root_cache_on(self):
+        '''Let bt_search reuse the root propagation of an earlier search
+           of the CSP with the same propagator (see CSP.get_root_state)'''
+        self.ROOT_CACHE = True
+
+    def root_cache_off(self):
+        '''Make bt_search always run root propagation, e.g. for a
+           propagator whose result before any assignment depends on more
+           than the CSP'''
+        self.ROOT_CACHE = False
+
+    def checkpoint_on(self, path, interval=CHECKPOINT_INTERVAL):
+        '''Make bt_search save its state to path every interval seconds,
+           and when it is stopped by request_stop. A later bt_search(...,
+           resume=path) on the same CSP, possibly in a new process,
+           continues from the saved state without searching again the
+           subtrees already finished. The file is removed once the
+           search ends. Domain values must be JSON serializable and
+           variable names unique.'''
+        self.checkpoint_path = path
+        self.checkpoint_interval = interval
+
+    def checkpoint_off(self):
+        '''Stop bt_search writing checkpoints'''
+        self.checkpoint_path = None
+
         
     def clear_stats(self):
         '''Initialize counters'''
         self.nDecisions = 0
         self.nPrunings = 0
         self.runtime = 0
+        self.depth = 0
+        self.start_time = time.perf_counter()
+
+    def request_stop(self):
+        '''Ask a running bt_search to stop at its next decision. Safe to
+           call from another thread; bt_search then unwinds, restoring the
+           variable domains, and returns None. A stop requested before
+           bt_search starts (e.g. while it waits for a thread) stops it at
+           its first decision; each request stops one search.'''
+        self.stop_requested = True
+        if self.sub_solver is not None:
+            self.sub_solver.request_stop()
+
+    def progress(self):
+        '''Return a snapshot of the search statistics (can be called from
+           another thread while bt_search is running)'''
+        return {'nodes': self.nDecisions,
+                'prunings': self.nPrunings,
+                'depth': self.depth,
+                'elapsed': time.perf_counter() - self.start_time,
+                'best': self.best_value}
+
+    def save_checkpoint(self, path=None):
+        '''Write the current search state to path (default: the
+           checkpoint_on path). The file is replaced atomically, so a
+           crash while writing leaves the previous checkpoint intact.
+
+           The state is the decision stack: for each level of bt_recurse
+           the variable, the value being explored and the values still to
+           try, plus the search statistics.'''
+        path = path or self.checkpoint_path
+        state = {'csp': self.csp.name,
+                 'nDecisions': self.nDecisions,
+                 'nPrunings': self.nPrunings,
+                 'cpu_time': self.cpu_offset + time.process_time() - self.cpu_start,
+                 'frames': [[var.name, order[i], list(order[i+1:])]
+                            for var, order, i in self.frames],
+                 'unassigned': [var.name for var in self.unasgn_vars]}
+        tmp = path + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(state, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+        self.next_checkpoint = time.perf_counter() + self.checkpoint_interval
+
+    def load_checkpoint(self, path):
+        '''Read a checkpoint written by save_checkpoint. Returns its
+           decision stack as a list of (Variable, value, remaining values)
+           and the unassigned variables below it in the order the search
+           kept them, setting the statistics from the checkpoint. Returns
+           None if the checkpoint does not belong to this CSP.'''
+        with open(path) as f:
+            state = json.load(f)
+        by_name = dict((var.name, var) for var in self.csp.vars)
+        if state['csp'] != self.csp.name or \
+           any(name not in by_name for name in
+               [f[0] for f in state['frames']] + state['unassigned']):
+            print("Checkpoint", path, "does not match CSP", self.csp.name)
+            return None
+        #replaying the stack assigns again every variable but the deepest
+        self.nDecisions = state['nDecisions'] - max(0, len(state['frames']) - 1)
+        self.nPrunings = state['nPrunings']
+        self.cpu_offset = state['cpu_time']
+        return ([(by_name[name], val, rest) for name, val, rest in state['frames']],
+                [by_name[name] for name in state['unassigned']])
 
     def print_stats(self):
         print("Search made {} variable assignments and pruned {} variable values".format(
@@ -425,7 +1069,7 @@ class BT:
         '''Add variable back to list of unassigned vars'''
         self.unasgn_vars.append(var)
         
-    def bt_search(self,propagator,var_ord=None,val_ord=None):
+    def bt_search(self,propagator,var_ord=None,val_ord=None,decompose=False,parallel=False,resume=None,hint=None):
         '''Try to solve the CSP using specified propagator routine
 
            propagator == a function with the following template
@@ -459,13 +1103,66 @@ class BT:
 
            var_ord is the variable ordering function currently being used; 
            val_ord is the value ordering function currently being used.
+
+           If decompose is True, after root propagation the variables
+           propagation left with a single value are assigned and the rest
+           of the CSP is split into independent parts (CSP.components),
+           each searched on its own, so a failure in one part never
+           causes backtracking over another. With parallel also True the
+           parts are searched in separate processes (the propagator and
+           orderings must then be picklable, e.g. module level functions).
+
+           resume is the path of a checkpoint (see checkpoint_on) to
+           continue from: the decisions it records are replayed, each with
+           its propagation, and search goes on from there. The propagator
+           and orderings must be the ones the checkpointed search used.
+           Checkpoints are not written when decompose is True.
+
+           hint is a warm start, e.g. the solution of a similar CSP: a dict
+           mapping variables (or variable names, so the solution of another
+           CSP with the same variable names can be used) to values. Each
+           time the search branches on a hinted variable it tries the
+           hinted value first, if still in the domain, before the order
+           given by val_ord. With phase saving on (see phase_saving_on) the
+           values remembered from backtracking are tried first in the same
+           way; hint then sets the starting values. The parts searched in
+           parallel processes (parallel=True) ignore both.
+
+           The result of root propagation is cached on the CSP, so a later
+           search of the same CSP with the same propagator starts straight
+           from it, unless variables, domain values or constraints were
+           added in between (see CSP.get_root_state and root_cache_off).
+
+           Returns True if a solution was found (the variables are left
+           assigned to it) and False if the CSP has no solution. Returns
+           None if the search was stopped by request_stop.
            '''
 
         if self.csp is None or propagator is None:
             return
 
         self.clear_stats()
+        self.solutions = []
+        self.frames = []
+        self.stop_saved = False
+        self.cpu_offset = 0
+        if not self.PHASE_SAVING:
+            self.phase = dict()
+        if hint:
+            names = dict((v.name, v) for v in self.csp.vars)
+            for key, val in hint.items():
+                var = names.get(key) if type(key) is str else key
+                if var is not None:
+                    self.phase[var] = val
+        replay = None
+        if resume is not None:
+            loaded = self.load_checkpoint(resume)
+            if loaded is None:
+                return
+            replay, order = loaded
         stime = time.process_time()
+        self.cpu_start = stime
+        self.next_checkpoint = time.perf_counter() + self.checkpoint_interval
 
         self.restore_all_variable_domains()
         
@@ -473,9 +1170,13 @@ class BT:
         for v in self.csp.vars:
             if not v.is_assigned():
                 self.unasgn_vars.append(v)
+        if replay is not None:
+            #same order as the checkpointed search, for var_ord=None
+            self.unasgn_vars = [var for var, val, rest in replay] + order
 
-        status, prunings = propagator(self.csp) #initial propagate no assigned variables.
-        
+        #initial propagate no assigned variables (or reuse the result of
+        #an earlier search of this CSP with the same propagator)
+        status, prunings = self.root_propagate(propagator, self.ROOT_CACHE)
         if prunings is None:
             return
 
@@ -486,36 +1187,318 @@ class BT:
             print("Root Prunings: ", prunings)
 
         if status == False:
-            print("CSP{} detected contradiction at root".format(
-                self.csp.name))
+            if not self.QUIET:
+                print("CSP{} detected contradiction at root".format(
+                    self.csp.name))
         else:
-            status = self.bt_recurse(propagator, var_ord, val_ord, 1)   #now do recursive search
+            if decompose:
+                status = self.bt_components(propagator, var_ord, val_ord, parallel)
+            else:
+                status = self.bt_recurse(propagator, var_ord, val_ord, 1, replay)   #now do recursive search
+
+        if status and self.PHASE_SAVING:
+            #the next search starts from the solution found
+            for v in self.csp.vars:
+                if v.is_assigned():
+                    self.phase[v] = v.get_assigned_value()
 
         self.restoreValues(prunings)
+        self.runtime = self.cpu_offset + time.process_time() - stime
+        #the stop request (if any) is used up by this search
+        stopped = self.stop_requested
+        self.stop_requested = False
+        if self.checkpoint_path is not None and not stopped \
+           and os.path.exists(self.checkpoint_path):
+            #the search is over; its checkpoint is of no further use
+            os.remove(self.checkpoint_path)
+        if stopped:
+            status = None
+            if not self.QUIET:
+                print("CSP {} search stopped on request".format(self.csp.name))
+        if self.QUIET:
+            return status
         if status == False:
             print("CSP{} unsolved. Has no solutions".format(self.csp.name))
         if status == True:
             print("CSP {} solved. CPU Time used = {}".format(self.csp.name,
-                                                             time.process_time() - stime))
+                                                             self.runtime))
             self.csp.print_soln()
 
         print("bt_search finished")
         self.print_stats()
+        return status
+
+    def root_propagate(self, propagator, use_cache=True):
+        '''Run propagator before any assignment, or, if use_cache is True,
+           reuse its result cached on the CSP (see CSP.get_root_state)
+           and cache a new one. Returns what the propagator returns.'''
+        cached = self.csp.get_root_state(propagator) if use_cache else None
+        if cached is not None:
+            return cached
+        status, prunings = propagator(self.csp)
+        if use_cache and prunings is not None:
+            self.csp.save_root_state(propagator, status, prunings)
+        return status, prunings
+
+    def count_solutions(self, propagator, var_ord=None, val_ord=None, limit=None, hint=None):
+        '''Count the solutions of the CSP, stopping as soon as limit of
+           them have been found (limit=None counts them all); hint is
+           passed on to bt_search. Returns the
+           number found; the solutions themselves are left in
+           self.solutions as dicts Variable --> value. Prints nothing and
+           leaves the variables unassigned with their domains restored.
+
+           With limit=2 this is a uniqueness check: it returns 1 exactly
+           when the CSP has a single solution.'''
+        def record():
+            #record the solution and keep searching until the limit
+            self.solutions.append(dict((v, v.get_assigned_value()) for v in self.csp.vars))
+            return limit is not None and len(self.solutions) >= limit
+
+        quiet = self.QUIET
+        self.QUIET = True
+        self.on_solution = record
+        try:
+            self.bt_search(propagator, var_ord, val_ord, hint=hint)
+        finally:
+            self.on_solution = None
+            self.QUIET = quiet
+        self.restore_all_variable_domains()
+        return len(self.solutions)
+
+    def bb_search(self, propagator, objective, var_ord=None, val_ord=None, maximize=False, on_improve=None):
+        '''Branch and bound: find a solution minimizing (or, with
+           maximize=True, maximizing) a sum of per-variable terms.
+
+           objective == dict Variable --> function of that variable's
+           value, e.g. {v: (lambda val: val) for v in diagonal} is the
+           sum of the diagonal, and
+           {v: (lambda val, p=p: val == p) for v, p in preferred} counts
+           the agreements with preferred values (use maximize=True).
+
+           The search goes on after each solution, requiring from then on
+           an objective value strictly better than the best found so far.
+           That bound is propagated together with propagator: after each
+           propagation the best objective value the current domains
+           still allow is computed, the subtree is cut if it is no better
+           than the bound, and values that would make it no better are
+           pruned (propagator is then run again from the pruned
+           variables).
+
+           self.best_value and self.best_solution (dict Variable -->
+           value) hold the best solution so far and can be read, like
+           progress(), while the search runs. If on_improve is given it
+           is called as on_improve(value, solution) with each improving
+           solution.
+
+           Returns True if a solution was found, the variables being left
+           assigned to an optimal one; False if the CSP has no solution;
+           None if the search was stopped by request_stop (best_solution
+           then holds the best solution found before stopping).'''
+
+        sign = -1 if maximize else 1
+
+        def cost(var, val):
+            #term of var, as a number to be minimized
+            return sign * objective[var](val)
+
+        use_cache = self.ROOT_CACHE
+
+        def bound_prop(csp, newVar=None):
+            if newVar is None:
+                #there is no bound yet: root propagation is the wrapped
+                #propagator's, cached under it rather than under this
+                #closure, which is made anew for every call
+                return self.root_propagate(propagator, use_cache)
+            status, prunings = propagator(csp, newVar)
+            if not status or self.best_value is None:
+                return status, prunings
+            prunings = list(prunings)
+            bound = sign * self.best_value
+            while True:
+                #smallest total the current domains allow
+                lb = 0
+                least = dict()
+                for var in objective:
+                    if var.is_assigned():
+                        lb = lb + cost(var, var.get_assigned_value())
+                    else:
+                        least[var] = min(cost(var, val) for val in var.cur_domain())
+                        lb = lb + least[var]
+                if lb >= bound:
+                    return False, prunings
+                #prune the values that cannot beat the bound
+                changed = []
+                for var, m in least.items():
+                    for val in var.cur_domain():
+                        if lb - m + cost(var, val) >= bound:
+                            var.prune_value(val)
+                            prunings.append((var, val))
+                            if not changed or changed[-1] is not var:
+                                changed.append(var)
+                if not changed:
+                    return True, prunings
+                for var in changed:
+                    status, more = propagator(csp, var)
+                    prunings.extend(more)
+                    if not status:
+                        return False, prunings
+
+        def improve():
+            value = sum(objective[var](var.get_assigned_value()) for var in objective)
+            self.best_value = value
+            self.best_solution = dict((v, v.get_assigned_value()) for v in self.csp.vars)
+            if self.TRACE:
+                print("bb_search improved objective to", value)
+            if on_improve is not None:
+                on_improve(value, dict(self.best_solution))
+            return False    #keep searching for a better one
+
+        self.best_value = None
+        self.best_solution = None
+        quiet = self.QUIET
+        self.QUIET = True
+        self.ROOT_CACHE = False
+        self.on_solution = improve
+        try:
+            status = self.bt_search(bound_prop, var_ord, val_ord)
+        finally:
+            self.on_solution = None
+            self.QUIET = quiet
+            self.ROOT_CACHE = use_cache
+
+        if status is not None:
+            self.restore_all_variable_domains()
+            status = self.best_solution is not None
+            if status:
+                for var, val in self.best_solution.items():
+                    var.assign(val)
+        if self.QUIET:
+            return status
+        if status == False:
+            print("CSP{} unsolved. Has no solutions".format(self.csp.name))
+        elif status == True:
+            print("CSP {} solved. Optimal objective value = {}. CPU Time used = {}".format(
+                self.csp.name, self.best_value, self.runtime))
+            self.csp.print_soln()
+        else:
+            print("CSP {} search stopped on request. Best objective value so far = {}".format(
+                self.csp.name, self.best_value))
+        print("bb_search finished")
+        self.print_stats()
+        return status
+
+    def bt_components(self, propagator, var_ord, val_ord, parallel=False):
+        '''Search each independent part of the CSP separately (see
+           bt_search). Returns True if every part was solved; otherwise
+           undoes its assignments and prunings and returns False.'''
+
+        assigned = []
+        all_prunes = []
+        solved = []     #(part, current domains before its search) of each part solved
+
+        def undo():
+            #unwind the parts solved (assignments, then the values their
+            #search left pruned) and then the fixed variables
+            for comp, before in reversed(solved):
+                for v in comp:
+                    v.unassign()
+                    for val in before[v]:
+                        if not v.in_cur_domain(val):
+                            v.unprune_value(val)
+                self.unasgn_vars.extend(comp)
+            self.restoreValues(all_prunes)
+            for v in assigned:
+                v.unassign()
+            self.unasgn_vars.extend(assigned)
+
+        #Assign the variables root propagation fixed, propagating each so
+        #the constraints over them are checked
+        for v in list(self.unasgn_vars):
+            if v.cur_domain_size() == 1 and not v.is_assigned():
+                v.assign(v.cur_domain()[0])
+                self.unasgn_vars.remove(v)
+                assigned.append(v)
+                status, prunings = propagator(self.csp, v)
+                all_prunes.extend(prunings)
+                self.nPrunings = self.nPrunings + len(prunings)
+                if not status:
+                    undo()
+                    return False
 
-    def bt_recurse(self, propagator, var_ord, val_ord, level):
+        comps = self.csp.components()
+        if self.TRACE:
+            print("bt_components: {} fixed variables, components of sizes {}".format(
+                len(assigned), [len(comp) for comp in comps]))
+
+        if parallel and len(comps) > 1:
+            import concurrent.futures
+            with concurrent.futures.ProcessPoolExecutor() as pool:
+                jobs = [pool.submit(_solve_component, self.csp.sub_csp(comp), len(comp),
+                                    propagator, var_ord, val_ord)
+                        for comp in comps]
+                results = [job.result() for job in jobs]
+            for comp, (values, nDecisions, nPrunings) in zip(comps, results):
+                self.nDecisions = self.nDecisions + nDecisions
+                self.nPrunings = self.nPrunings + nPrunings
+            if any(values is None for values, n, p in results):
+                undo()
+                return False
+            for comp, (values, n, p) in zip(comps, results):
+                for v, val in zip(comp, values):
+                    v.assign(val)
+                    self.unasgn_vars.remove(v)
+                    assigned.append(v)
+            return True
+
+        for comp in comps:
+            if self.stop_requested:
+                undo()
+                return False
+            self.sub_solver = BT(self.csp.sub_csp(comp))
+            self.sub_solver.TRACE = self.TRACE
+            self.sub_solver.unasgn_vars = list(comp)
+            self.sub_solver.phase = self.phase
+            self.sub_solver.PHASE_SAVING = self.PHASE_SAVING
+            #the search of a part only prunes the part's own variables
+            before = dict((v, v.cur_domain()) for v in comp)
+            status = self.sub_solver.bt_recurse(propagator, var_ord, val_ord, 1)
+            self.nDecisions = self.nDecisions + self.sub_solver.nDecisions
+            self.nPrunings = self.nPrunings + self.sub_solver.nPrunings
+            self.sub_solver = None
+            if not status:
+                undo()
+                return False
+            for v in comp:
+                self.unasgn_vars.remove(v)
+            solved.append((comp, before))
+        return True
+
+    def bt_recurse(self, propagator, var_ord, val_ord, level, replay=None):
         '''Return true if found solution. False if still need to search.
-           If top level returns false--> no solution'''
+           If top level returns false--> no solution
+
+           replay == decision stack read from a checkpoint: this level
+           takes its variable and values from replay[0] instead of the
+           orderings, and its first value resumes with replay[1:].'''
 
         if self.TRACE:
             print('  ' * level, "bt_recurse level ", level)
+        self.depth = level
            
         if not self.unasgn_vars:
             #all variables assigned
-            return True
+            if self.on_solution is None:
+                return True
+            return self.on_solution()
         else:
             ##Figure out which variable to assign,
             ##Then remove it from the list of unassigned vars
-            if var_ord:
+            resumed = bool(replay)
+            if resumed:
+              var, val, rest = replay[0]
+              replay = replay[1:]
+            elif var_ord:
               var = var_ord(self.csp)
             else:
               var = self.unasgn_vars[0]
@@ -524,12 +1507,34 @@ class BT:
             if self.TRACE:
                 print('  ' * level, "bt_recurse var = ", var)
 
-            if val_ord:
+            if resumed:
+              #the values before val were finished before the checkpoint
+              value_order = [val] + rest
+            elif val_ord:
               value_order = val_ord(self.csp,var)
             else:
               value_order = var.cur_domain()
+            if not resumed and var in self.phase:
+              #hinted or saved value first
+              first = self.phase[var]
+              if first in value_order and value_order[0] != first:
+                value_order = [first] + [v for v in value_order if v != first]
+
+            frame = [var, value_order, 0]
+            self.frames.append(frame)
 
-            for val in value_order:
+            for i, val in enumerate(value_order):
+                frame[2] = i
+
+                if self.stop_requested:
+                    if self.checkpoint_path is not None and not self.stop_saved:
+                        #save once, at the deepest level, before unwinding
+                        self.save_checkpoint()
+                        self.stop_saved = True
+                    break
+
+                if self.checkpoint_path is not None and time.perf_counter() >= self.next_checkpoint:
+                    self.save_checkpoint()
 
                 if self.TRACE:
                     print('  ' * level, "bt_recurse trying", var, "=", val)
@@ -545,14 +1550,233 @@ class BT:
                     print('  ' * level, "bt_recurse prop pruned = ", prunings)
 
                 if status:
-                    if self.bt_recurse(propagator, var_ord,val_ord, level+1):
+                    if self.bt_recurse(propagator, var_ord,val_ord, level+1, replay):
+                        self.frames.pop()
                         return True
+                #only the first value continues the checkpointed subtree
+                replay = None
 
                 if self.TRACE:
                     print('  ' * level, "bt_recurse restoring ", prunings)
                 self.restoreValues(prunings)
                 var.unassign()
+                if self.PHASE_SAVING:
+                    self.phase[var] = val
 
+            self.frames.pop()
             self.restoreUnasgnVar(var)
             return False
 
+def _solve_component(csp, n, propagator, var_ord, val_ord):
+    '''Search the first n variables of csp (a CSP.sub_csp part), run in a
+       worker process by bt_components. Returns (values of the n
+       variables or None if unsolvable, decisions, prunings).'''
+    solver = BT(csp)
+    solver.unasgn_vars = csp.get_all_vars()[:n]
+    status = solver.bt_recurse(propagator, var_ord, val_ord, 1)
+    values = None
+    if status:
+        values = [v.get_assigned_value() for v in csp.get_all_vars()[:n]]
+    return values, solver.nDecisions, solver.nPrunings
+
+########################################################
+# Min-Conflicts Local Search                           #
+########################################################
+
+class MinConflicts:
+    '''Local search for large, loosely constrained CSPs (e.g. n-Queens
+       with large n) where systematic search is hopeless. Make one of
+       these objects passing the CSP, then call its mc_search routine.
+
+       Search starts from a greedy complete assignment and repeatedly
+       picks a variable in a violated constraint and moves it to the
+       value violating the fewest constraints. To escape local minima
+       a variable may not return to a value it left for tabu_tenure
+       steps (unless that would beat the best assignment seen), and with
+       probability walk_prob a random value is taken instead.
+
+       The number of violated constraints each variable is in is kept
+       up to date as variables move, so a step only rechecks the
+       constraints of the variable moved and of the values tried for it.
+
+       mc_search can not prove a CSP has no solution: it returns False
+       when its step budget runs out.'''
+
+    def __init__(self, csp, seed=None):
+        '''csp == CSP object specifying the CSP to be solved
+           seed == seed for the random choices (None: unseeded)'''
+
+        self.csp = csp
+        self.rng = random.Random(seed)
+        self.nSteps = 0     #nSteps is the number of variable moves made
+        self.nChecks = 0    #nChecks is the number of constraint checks made
+        self.QUIET = False  #when True mc_search prints nothing
+        self.runtime = 0
+
+    def quiet_on(self):
+        '''Stop mc_search printing results and statistics'''
+        self.QUIET = True
+
+    def quiet_off(self):
+        '''Let mc_search print results and statistics'''
+        self.QUIET = False
+
+    def print_stats(self):
+        print("Search made {} moves and {} constraint checks".format(
+            self.nSteps, self.nChecks))
+
+    def mc_search(self, max_steps=MC_MAX_STEPS, tabu_tenure=MC_TABU_TENURE, walk_prob=MC_WALK_PROB):
+        '''Try to solve the CSP by min-conflicts local search, making at
+           most max_steps moves.
+
+           Returns True if a solution was found (the variables are left
+           assigned to it, as with bt_search) and False if the budget ran
+           out (the variables are left unassigned). The values tried for
+           each variable are those of its current domain once all domains
+           are restored, i.e. its whole domain.'''
+
+        if self.csp is None:
+            return
+
+        self.nSteps = 0
+        self.nChecks = 0
+        stime = time.process_time()
+        for var in self.csp.vars:
+            if var.is_assigned():
+                var.unassign()
+            var.restore_curdom()
+
+        self.value = dict()         #variable --> current value
+        self.violated = set()       #constraints the current values violate
+        self.conflicts = dict()     #variable --> number of its constraints violated
+        self.conflicted = []        #variables with conflicts > 0
+        self.conflicted_at = dict() #variable --> its index in conflicted
+        for var in self.csp.vars:
+            self.conflicts[var] = 0
+        self._greedy_start()
+
+        status = self._search(max_steps, tabu_tenure, walk_prob)
+        if status:
+            for var in self.csp.vars:
+                var.assign(self.value[var])
+        self.runtime = time.process_time() - stime
+
+        if self.QUIET:
+            return status
+        if status:
+            print("CSP {} solved. CPU Time used = {}".format(self.csp.name, self.runtime))
+            self.csp.print_soln()
+        else:
+            print("CSP {} not solved in {} moves ({} constraints still violated)".format(
+                self.csp.name, max_steps, len(self.violated)))
+        print("mc_search finished")
+        self.print_stats()
+        return status
+
+    def _greedy_start(self):
+        '''Give the variables, in random order, a value violating the
+           fewest constraints whose other variables already have one'''
+        order = list(self.csp.vars)
+        self.rng.shuffle(order)
+        for var in order:
+            best = []
+            best_cost = None
+            for val in var.cur_domain():
+                cost = self._cost(var, val)
+                if best_cost is None or cost < best_cost:
+                    best, best_cost = [val], cost
+                elif cost == best_cost:
+                    best.append(val)
+            self._set(var, self.rng.choice(best))
+
+    def _search(self, max_steps, tabu_tenure, walk_prob):
+        tabu = dict()               #(variable, value) --> step the move is tabu until
+        best_violated = len(self.violated)
+        while self.violated:
+            if self.nSteps >= max_steps:
+                return False
+            self.nSteps = self.nSteps + 1
+
+            var = self.conflicted[self.rng.randrange(len(self.conflicted))]
+            old = self.value[var]
+            vals = [val for val in var.cur_domain() if val != old]
+            if not vals:
+                continue
+            if self.rng.random() < walk_prob:
+                val = self.rng.choice(vals)
+            else:
+                #fewest violated constraints if var took val instead
+                here = self.conflicts[var]
+                best = []
+                best_cost = None
+                for val in vals:
+                    cost = self._cost(var, val)
+                    #aspiration: a tabu move is allowed if it beats the best so far
+                    if tabu.get((var, val), 0) > self.nSteps and \
+                       len(self.violated) - here + cost >= best_violated:
+                        continue
+                    if best_cost is None or cost < best_cost:
+                        best, best_cost = [val], cost
+                    elif cost == best_cost:
+                        best.append(val)
+                if not best:
+                    continue
+                val = self.rng.choice(best)
+
+            tabu[(var, old)] = self.nSteps + tabu_tenure
+            self._set(var, val)
+            if len(self.violated) < best_violated:
+                best_violated = len(self.violated)
+        return True
+
+    def _cost(self, var, val):
+        '''number of constraints over var violated if var took val, counting
+           only constraints all of whose other variables have a value'''
+        cost = 0
+        for c in self.csp.vars_to_cons[var]:
+            vals = []
+            for v in c.scope:
+                if v is var:
+                    vals.append(val)
+                elif v in self.value:
+                    vals.append(self.value[v])
+                else:
+                    break
+            else:
+                self.nChecks = self.nChecks + 1
+                if not c.check(vals):
+                    cost = cost + 1
+        return cost
+
+    def _set(self, var, val):
+        '''Give var value val, updating the violated constraints and the
+           conflict counts of the variables in their scopes'''
+        self.value[var] = val
+        for c in self.csp.vars_to_cons[var]:
+            if any(not v in self.value for v in c.scope):
+                continue
+            self.nChecks = self.nChecks + 1
+            now = not c.check([self.value[v] for v in c.scope])
+            if now == (c in self.violated):
+                continue
+            if now:
+                self.violated.add(c)
+                change = 1
+            else:
+                self.violated.discard(c)
+                change = -1
+            for v in c.scope:
+                self.conflicts[v] = self.conflicts[v] + change
+                if self.conflicts[v] == 0:
+                    self._drop_conflicted(v)
+                elif self.conflicts[v] == change == 1:
+                    self.conflicted_at[v] = len(self.conflicted)
+                    self.conflicted.append(v)
+
+    def _drop_conflicted(self, var):
+        #swap with the last entry so removal is O(1)
+        k = self.conflicted_at.pop(var)
+        last = self.conflicted.pop()
+        if last is not var:
+            self.conflicted[k] = last
+            self.conflicted_at[last] = k
@@ -0,0 +1,203 @@
+'''Batch propagation of many same-size Futoshiki boards with NumPy.
+
+   Running prop_GAC board by board spends most of its time in the
+   interpreter. Here a whole batch of n x n boards is held in NumPy
+   arrays and propagated at once:
+
+       dom[b, i, j]   bitmask of the values left for cell (i, j) of board
+                      b (bit v-1 set if value v is possible)
+       lt[b, i, j]    cell (i, j) < cell (i, j+1) on board b
+       gt[b, i, j]    cell (i, j) > cell (i, j+1) on board b
+
+   propagate_batch applies, to every board at the same time and until
+   nothing changes,
+
+       - not-equal: a cell's value is removed from the rest of its row
+         and column (two cells of a row or column fixed to the same
+         value is a dead end)
+       - hidden single: a value possible in only one cell of a row or
+         column is that cell's value (and possible in none is a dead end)
+       - inequality bounds: the cell on the small side of '<' or '>'
+         keeps only values below the largest value of the other cell,
+         and the cell on the big side only values above its smallest
+
+   solve_batch(boards) ==> list of solutions (rows of values, or None)
+
+       propagates the batch, then reads off the boards propagation
+       solved or found unsolvable. Only boards still needing to branch
+       are searched one at a time with bt_search, starting from the
+       domains propagation left.
+
+   NumPy is optional: without it solve_batch searches every board with
+   bt_search.
+'''
+
+from cspbase import *
+from propagators import *
+from futoshiki_csp import *
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+MAX_BATCH_ROUNDS = 100  #propagate_batch gives up on a fixpoint after this many rounds
+
+def parse_boards(boards):
+    '''Stack same-size boards (grid format of futoshiki_csp) into the
+       (dom, lt, gt) arrays described above'''
+    n = len(boards[0])
+    full = (1 << n) - 1
+    dom = np.full((len(boards), n, n), full, dtype=np.uint16)
+    lt = np.zeros((len(boards), n, n - 1), dtype=bool)
+    gt = np.zeros((len(boards), n, n - 1), dtype=bool)
+    for b, board in enumerate(boards):
+        for i, row in enumerate(board):
+            for j, x in enumerate(row):
+                if j % 2 == 0:
+                    if x != 0:
+                        dom[b, i, j // 2] = 1 << (x - 1)
+                elif x == '<':
+                    lt[b, i, j // 2] = True
+                elif x == '>':
+                    gt[b, i, j // 2] = True
+    return dom, lt, gt
+
+def _bit_tables(n):
+    '''popcount, lowest bit and highest bit of every n-bit mask'''
+    masks = np.arange(1 << n)
+    bits = (masks[:, None] >> np.arange(n)) & 1
+    popcount = bits.sum(axis=1)
+    low = (masks & -masks).astype(np.uint16)
+    high = np.zeros(1 << n, dtype=np.uint16)
+    for v in range(n):
+        high[masks >> v == 1] = 1 << v
+    return popcount, low, high
+
+def _not_equal(dom, popcount, axis):
+    '''not-equal rule along rows (axis=2) or columns (axis=1). Returns
+       the new domains and the boards found dead.'''
+    single = popcount[dom] == 1
+    fixed = np.where(single, dom, 0)
+    used = np.bitwise_or.reduce(fixed, axis=axis, keepdims=True)
+    dead = (popcount[used] < single.sum(axis=axis, keepdims=True)).any(axis=(1, 2))
+    return np.where(single, dom, dom & ~used), dead
+
+def _hidden_single(dom, values, axis):
+    '''hidden single rule along rows (axis=2) or columns (axis=1).
+       Returns the new domains and the boards found dead.'''
+    possible = (dom[..., None] & values) != 0          #board x cell x value
+    count = possible.sum(axis=axis, keepdims=True)
+    dead = (count == 0).any(axis=(1, 2, 3))
+    hidden = possible & (count == 1)
+    forced = np.bitwise_or.reduce(np.where(hidden, values, 0), axis=3)
+    #a cell forced to take two values is a dead end too
+    dead |= (hidden.sum(axis=3) > 1).any(axis=(1, 2))
+    return np.where(forced != 0, forced, dom), dead
+
+def _inequalities(dom, lt, gt, low, high):
+    '''bounds rule for the inequalities between horizontal neighbours'''
+    left = dom[:, :, :-1]
+    right = dom[:, :, 1:]
+    below = lambda m: high[m] - 1                       #values under the largest of m
+    above = lambda m: ~((low[m] << 1) - 1)              #values over the smallest of m
+    new_left = np.where(lt, left & below(right), np.where(gt, left & above(right), left))
+    new_right = np.where(lt, right & above(left), np.where(gt, right & below(left), right))
+    dom = dom.copy()
+    dom[:, :, :-1] = new_left
+    dom[:, :, 1:] &= new_right
+    return dom
+
+def propagate_batch(dom, lt, gt):
+    '''Propagate every board of the batch to a fixpoint of the rules
+       above. Returns (dom, dead), dead[b] being True if board b has no
+       solution.'''
+    n = dom.shape[1]
+    popcount, low, high = _bit_tables(n)
+    values = (1 << np.arange(n)).astype(np.uint16)
+    dead = np.zeros(dom.shape[0], dtype=bool)
+    for r in range(MAX_BATCH_ROUNDS):
+        old = dom
+        dom, d1 = _not_equal(dom, popcount, 2)
+        dom, d2 = _not_equal(dom, popcount, 1)
+        dom = _inequalities(dom, lt, gt, low, high)
+        dom, d3 = _hidden_single(dom, values, 2)
+        dom, d4 = _hidden_single(dom, values, 1)
+        dead |= d1 | d2 | d3 | d4 | (dom == 0).any(axis=(1, 2))
+        #dead boards are left as they are so they stop changing
+        dom = np.where(dead[:, None, None], old, dom)
+        if np.array_equal(dom, old):
+            break
+    return dom, dead
+
+def _seeded(propagator, var_array, masks):
+    '''propagator that, before any assignment, first prunes the values the
+       batch propagation removed (bt_search restores all domains when it
+       starts, so they cannot simply be pruned beforehand)'''
+    def seeded_prop(csp, newVar=None):
+        if newVar is not None:
+            return propagator(csp, newVar)
+        pruned = []
+        for i, row in enumerate(var_array):
+            for j, var in enumerate(row):
+                for val in var.cur_domain():
+                    if not masks[i][j] >> (val - 1) & 1:
+                        var.prune_value(val)
+                        pruned.append((var, val))
+        status, prunings = propagator(csp)
+        return status, pruned + prunings
+    return seeded_prop
+
+def _search(board, masks, model, propagator, var_ord, stats):
+    '''Search one board with bt_search; masks are its starting domains
+       (None for the full domains)'''
+    if model == 1:
+        csp, var_array = futoshiki_csp_model_1(board)
+    else:
+        csp, var_array = futoshiki_csp_model_2(board)
+    if masks is not None:
+        propagator = _seeded(propagator, var_array, masks)
+    solver = BT(csp)
+    solver.quiet_on()
+    status = solver.bt_search(propagator, var_ord)
+    if stats is not None:
+        stats['searched'] = stats.get('searched', 0) + 1
+        stats['nodes'] = stats.get('nodes', 0) + solver.nDecisions
+    if not status:
+        return None
+    return [[var.get_assigned_value() for var in row] for row in var_array]
+
+def solve_batch(boards, model=1, propagator=prop_GAC, var_ord=ord_mrv, stats=None):
+    '''Solve a list of same-size boards. Returns one entry per board: the
+       solution as a list of rows of values, or None if it has none.
+
+       If stats is a dict it gets the number of boards solved and proved
+       unsolvable by batch propagation alone ('solved', 'unsat'), of
+       boards searched ('searched') and of search decisions ('nodes').'''
+    if stats is not None:
+        stats.update({'solved': 0, 'unsat': 0, 'searched': 0, 'nodes': 0})
+    if not boards:
+        return []
+    if np is None:
+        return [_search(board, None, model, propagator, var_ord, stats) for board in boards]
+
+    dom, lt, gt = parse_boards(boards)
+    dom, dead = propagate_batch(dom, lt, gt)
+    n = dom.shape[1]
+    popcount = _bit_tables(n)[0]
+    fixed = (popcount[dom] == 1).all(axis=(1, 2))
+
+    results = []
+    for b, board in enumerate(boards):
+        if dead[b]:
+            results.append(None)
+            if stats is not None:
+                stats['unsat'] += 1
+        elif fixed[b]:
+            #one bit per cell: its position is the value
+            results.append((np.log2(dom[b]).astype(int) + 1).tolist())
+            if stats is not None:
+                stats['solved'] += 1
+        else:
+            results.append(_search(board, dom[b].tolist(), model, propagator, var_ord, stats))
+    return results
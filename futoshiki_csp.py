@@ -45,223 +45,356 @@ cell of the Futoshiki puzzle.
      [0,.,0,.,0],
      [0,.,0,<,0]]
 
+    Most of the work of building a model only depends on the size of the
+    board: the not-equal/all-different tables and the row and column
+    constraint skeletons are the same for every n x n board. These are
+    built once per (n, model) and kept in a small LRU cache, so building
+    a new board only creates its variables and attaches its inequality
+    constraints to the shared tables.
+
 '''
 import cspbase
 import itertools
+import functools
 
 from cspbase import *
 from propagators import *
 
-def futoshiki_csp_model_1(futo_grid):
-    ##IMPLEMENT
-
-    #Create a list of feasible values in the domain of all unassigned cells
-    dom = []
-    for i in range(1,len(futo_grid)+1):
-        dom.append(i)
-
-    all_vars = []
-
-    #Create a variable type for all indices that are numeric
-    for i in range(len(futo_grid)):
-        row_vars = []
-        for j in range(len(futo_grid[i])):
-            #Check if a cell is numeric
-            if type(futo_grid[i][j]) == int:
-                #Check to see if the cell is 0, if it is assign its domain to the dom list made above
-                if futo_grid[i][j] == 0:
-                    row_vars.append(Variable(f'X{i}{j}', dom.copy()))
-                #Otherwise, assign its domain to the singular value specified at its index
-                else:
-                    row_vars.append(Variable(f'X{i}{j}', [futo_grid[i][j]]))
-        #Add all the row variables to the all_vars list
-        all_vars.append(row_vars)
-
-    #Create a list of constriants
-    cons = []
-    #Iterate through n cells (nxn grid)
-    for i in range(len(futo_grid)):
-        for j in range(len(futo_grid)):
-            #go to the cell right of j
-            for k in range(j+1, len(futo_grid)):
-                #all_vars is the list of variables (excluding the inequalities), so we can index on this 
-                con = Constraint(f'Row-{i}-X{i}{j}-X{i}{k}', [all_vars[i][j], all_vars[i][k]])  
-                #satisfiable variabels are any variable not equal to itself
-                sat_list = []
-                for x in dom: 
-                    for y in dom:  
-                        if x != y:  
-                            sat_list.append((x, y))
-                con.add_satisfying_tuples(sat_list)
-                cons.append(con)
-    
-    #Iterate through n cells (nxn grid)
-    for i in range(len(futo_grid)):
-        for j in range(len(futo_grid)):
-            #go to the cell below j
-            for k in range(j+1, len(futo_grid)):
-                #all_vars is the list of variables (excluding the inequalities), so we can index on this 
-                con = Constraint(f'Col-{i}-X{j}{i}-X{k}{i}', [all_vars[j][i], all_vars[k][i]])
-                #satisfiable variabels are any value not equal to itself
-                sat_list = []
-                for x in dom: 
-                    for y in dom:  
-                        if x != y:  
-                            sat_list.append((x, y))  
-                con.add_satisfying_tuples(sat_list)
-                cons.append(con)
-    
-    #Iterate through n cells (nxn grid)
-    for i in range(len(futo_grid)):
-        for j in range(len(futo_grid[i])):
-            #see if there is a greater than constraint
-            if futo_grid[i][j] == '<':
-                #Get the left pointer by dividing the index of j by 2 and taking the floor
-                lp = all_vars[i][j // 2] 
-                #Get the right pointer by dividing the index of j by 2 and adding 1 (get the ceiling)
-                rp = all_vars[i][(j // 2) + 1]  
-                con = Constraint(f'Ineq{i}{j}',[lp,rp])
-                #Satisfiable variables are any value y greater than x
-                sat_list = []
-                for x in dom: 
-                    for y in dom:  
-                        if x < y:  
-                            sat_list.append((x, y))
-                con.add_satisfying_tuples(sat_list)
-                cons.append(con)
-
-            #see if there is a less than constraint
-            elif futo_grid[i][j] == '>':
-                #Get the left pointer by dividing the index of j by 2 and taking the floor
-                lp = all_vars[i][j // 2]  
-                #Get the right pointer by dividing the index of j by 2 and adding 1 (get the ceiling)
-                rp = all_vars[i][(j // 2) + 1]  
-                con = Constraint(f'Ineq{i}{j}',[lp,rp])
-                #Satisfiable variables are any value y less than x
-                sat_list = []
-                for x in dom: 
-                    for y in dom:  
-                        if x > y:  
-                            sat_list.append((x, y))
-                con.add_satisfying_tuples(sat_list)
-                cons.append(con)
+MODEL_CACHE_SIZE = 8    #number of (n, model) table sets kept in the cache
+TUPLE_CHUNK = 4096      #permutations added to an all-different table at a time
 
-    
-    final_list = [] 
-    for i in all_vars:
-        for j in i:
-           final_list.append(j) 
-    #Intialize the CSP by adding the variables and the constraints             
-    csp = CSP("Futoshiki_CSP_Model_1", final_list)
-    for i in cons:
-        csp.add_constraint(i)
-    return csp, all_vars #Return the CSP and all the variables
+@functools.lru_cache(maxsize=MODEL_CACHE_SIZE)
+def _model_tables(n, model):
+    '''Build the relation tables and row/column constraint skeletons
+       shared by every n x n board of the given model (1 or 2).
 
-def futoshiki_csp_model_2(futo_grid):
-    ##IMPLEMENT
+       Returns (skeleton, ineq_tables). skeleton is a list of
+       (constraint name, list of (row, col) cells, Table, events) entries,
+       one per row/column constraint, where events are the domain change
+       events the constraint subscribes to. ineq_tables maps '<' and '>' to the
+       Table for that inequality.'''
 
     #Create a list of feasible values in the domain of all unassigned cells
-    dom = []
-    for i in range(1,len(futo_grid)+1):
-        dom.append(i)
+    dom = list(range(1, n+1))
+
+    skeleton = []
+    if model == 1:
+        #satisfiable values are any pair of values not equal to each other
+        neq = Table(2)
+        neq.add_tuples((x, y) for x in dom for y in dom if x != y)
+
+        #a not-equal constraint can only lose supports when one of its
+        #cells is fixed to a single value, so it subscribes to EVT_FIX only
+
+        #binary not-equal constraints between each pair of cells in a row
+        for i in range(n):
+            for j in range(n):
+                for k in range(j+1, n):
+                    skeleton.append((f'Row-{i}-X{i}{j}-X{i}{k}', [(i, j), (i, k)], neq, EVT_FIX))
+
+        #binary not-equal constraints between each pair of cells in a column
+        for i in range(n):
+            for j in range(n):
+                for k in range(j+1, n):
+                    skeleton.append((f'Col-{i}-X{j}{i}-X{k}{i}', [(j, i), (k, i)], neq, EVT_FIX))
+    else:
+        #satisfiable values are all permutations of the domain
+        alldiff = Table(n)
+        alldiff.add_tuples(itertools.permutations(dom, n), TUPLE_CHUNK)
+
+        for i in range(n):
+            skeleton.append((f'Row-{i}-AllDiff', [(i, j) for j in range(n)], alldiff, EVT_ALL))
+        for i in range(n):
+            skeleton.append((f'Col-{i}-AllDiff', [(j, i) for j in range(n)], alldiff, EVT_ALL))
+
+    #Satisfiable values for '<' are any value y greater than x, for '>'
+    #any value y less than x
+    lt = Table(2)
+    lt.add_tuples((x, y) for x in dom for y in dom if x < y)
+    gt = Table(2)
+    gt.add_tuples((x, y) for x in dom for y in dom if x > y)
+
+    return skeleton, {'<': lt, '>': gt}
+
+def clear_model_cache():
+    '''Drop all cached model tables'''
+    _model_tables.cache_clear()
+
+def _build_model(futo_grid, model, csp_name):
+    '''Build the CSP for futo_grid from the cached tables of its size'''
+
+    n = len(futo_grid)
+    skeleton, ineq_tables = _model_tables(n, model)
+
+    #Create the domain of all unassigned cells; a tuple is shared by the
+    #variables rather than copied into each
+    dom = tuple(range(1, n+1))
 
     all_vars = []
 
     #Create a variable type for all indices that are numeric
-    for i in range(len(futo_grid)):
+    for i in range(n):
         row_vars = []
         for j in range(len(futo_grid[i])):
             #Check if a cell is numeric
             if type(futo_grid[i][j]) == int:
                 #Check to see if the cell is 0, if it is assign its domain to the dom list made above
                 if futo_grid[i][j] == 0:
-                    row_vars.append(Variable(f'X{i}{j}', dom.copy()))
+                    row_vars.append(Variable(f'X{i}{j}', dom))
                 #Otherwise, assign its domain to the singular value specified at its index
                 else:
                     row_vars.append(Variable(f'X{i}{j}', [futo_grid[i][j]]))
         #Add all the row variables to the all_vars list
         all_vars.append(row_vars)
 
-    #Create a list of constriants
+    #Create the row and column constraints from the cached skeleton
     cons = []
-    #Make all-diff constraint
-    for i in range(len(futo_grid)):
-        con = Constraint(f'Row-{i}-AllDiff', all_vars[i])
-        sat_list = []  
-        #Add all permutations to sat_list 
-        for j in itertools.permutations(dom, len(futo_grid)):  
-            perm_list = list(j)  
-            sat_list.append(perm_list) 
-        con.add_satisfying_tuples(sat_list)
+    for name, cells, table, events in skeleton:
+        con = Constraint(name, [all_vars[r][c] for r, c in cells])
+        con.set_table(table)
+        con.subscribe(events)
         cons.append(con)
 
-    #Create a list of column variables for column all-diff
-    column_group = []  
-    for col in range(len(futo_grid)):
-        column = []  
-        # Iterate over each row index
-        for row in range(len(futo_grid)):
-            column.append(all_vars[row][col])  
-        column_group.append(column)  
-        
-    #Iterate through the column groups and make all-diff constraint   
-    for i in range(len(column_group)):
-        con = Constraint(f'Col-{i}-AllDiff', column_group[i])  
-        sat_list = []  
-        #Add all permutations to sat_list 
-        for k in itertools.permutations(dom, len(futo_grid)):
-            perm_list = list(k)  
-            sat_list.append(perm_list) 
-
-        con.add_satisfying_tuples(sat_list)
-        cons.append(con)
-            
-    #Iterate through n cells (nxn grid)
-    for i in range(len(futo_grid)):
+    #Attach the inequality constraints of this board
+    for i in range(n):
         for j in range(len(futo_grid[i])):
-            #see if there is a greater than constraint
-            if futo_grid[i][j] == '<':
+            if futo_grid[i][j] == '<' or futo_grid[i][j] == '>':
                 #Get the left pointer by dividing the index of j by 2 and taking the floor
-                lp = all_vars[i][j // 2] 
+                lp = all_vars[i][j // 2]
                 #Get the right pointer by dividing the index of j by 2 and adding 1 (get the ceiling)
-                rp = all_vars[i][(j // 2) + 1]  
-                con = Constraint(f'Ineq{i}{j}',[lp,rp])
-                #Satisfiable variables are any value y greater than x
-                sat_list = []
-                for x in dom: 
-                    for y in dom:  
-                        if x < y:  
-                            sat_list.append((x, y))
-                con.add_satisfying_tuples(sat_list)
+                rp = all_vars[i][(j // 2) + 1]
+                con = Constraint(f'Ineq{i}{j}', [lp, rp])
+                con.set_table(ineq_tables[futo_grid[i][j]])
+                #supports of an inequality only change with the bounds
+                con.subscribe(EVT_BOUND)
                 cons.append(con)
 
-            #see if there is a less than constraint
-            elif futo_grid[i][j] == '>':
-                #Get the left pointer by dividing the index of j by 2 and taking the floor
-                lp = all_vars[i][j // 2]  
-                #Get the right pointer by dividing the index of j by 2 and adding 1 (get the ceiling)
-                rp = all_vars[i][(j // 2) + 1]  
-                con = Constraint(f'Ineq{i}{j}',[lp,rp])
-                #Satisfiable variables are any value y less than x
-                sat_list = []
-                for x in dom: 
-                    for y in dom:  
-                        if x > y:  
-                            sat_list.append((x, y))
-                con.add_satisfying_tuples(sat_list)
-                cons.append(con)
-
-
-
-    final_list = [] 
+    final_list = []
     for i in all_vars:
         for j in i:
-           final_list.append(j) 
-    #Intialize CSP
-    csp = CSP("Futoshiki_CSP_Model_2", final_list)
+           final_list.append(j)
+    #Intialize the CSP by adding the variables and the constraints
+    csp = CSP(csp_name, final_list)
     for i in cons:
         csp.add_constraint(i)
-
     return csp, all_vars #Return the CSP and all the variables
 
+def futoshiki_csp_model_1(futo_grid):
+    ##IMPLEMENT
+    return _build_model(futo_grid, 1, "Futoshiki_CSP_Model_1")
 
+def futoshiki_csp_model_2(futo_grid):
+    ##IMPLEMENT
+    return _build_model(futo_grid, 2, "Futoshiki_CSP_Model_2")
+
+class FutoshikiSession:
+    '''Keep a compiled Futoshiki model and its root-propagated state so a
+       board can be edited one clue at a time and re-solved cheaply.
+
+       The model is built once with every cell given the full domain;
+       givens are applied as root prunings instead of singleton domains,
+       so they can be added and removed without rebuilding. Adding a
+       given or an inequality only propagates from the cells it touches,
+       starting from the current root state. Removing one relaxes the
+       problem, which GAC cannot undo incrementally, so the root state
+       is then recomputed (still without rebuilding the model).
+
+       solve() warm-starts search by trying each cell's value from the
+       previous solution first.
+
+       session = FutoshikiSession(board)
+       session.solve()             ==> list of rows of values, or None
+       session.set_given(0, 2, 3)  #cell (0,2) must be 3; 0 removes the given
+       session.set_inequality(1, 0, '<')  #cell (1,0) < cell (1,1); '.' removes
+       session.solve()
+       session.count_solutions(2)  ==> 1 if the board has a unique solution
+    '''
+
+    def __init__(self, futo_grid, model=1, propagator=prop_GAC, var_ord=ord_mrv, val_ord=None):
+        self.n = len(futo_grid)
+        self.propagator = propagator
+        self.var_ord = var_ord
+        self.val_ord = val_ord
+
+        #Build the model with no givens and no inequalities, then add them
+        empty = [[0 if type(x) == int else '.' for x in row] for row in futo_grid]
+        if model == 1:
+            self.csp, self.var_array = futoshiki_csp_model_1(empty)
+        else:
+            self.csp, self.var_array = futoshiki_csp_model_2(empty)
+        self.ineq_tables = _model_tables(self.n, model)[1]
+
+        self.givens = dict()        #(row, col) --> value
+        self.ineqs = dict()         #(row, col) --> (symbol, Constraint)
+        for i in range(self.n):
+            for j in range(len(futo_grid[i])):
+                x = futo_grid[i][j]
+                if type(x) == int and x != 0:
+                    self.givens[(i, j // 2)] = x
+                elif x == '<' or x == '>':
+                    self._add_ineq_constraint(i, j // 2, x)
+
+        self.solution = None        #Variable --> value of the last solution
+        self._propagate_root()
+
+    #
+    #editing the board
+    #
+
+    def set_given(self, row, col, value):
+        '''Make cell (row, col) a given with value, or remove its given if
+           value is 0'''
+        old = self.givens.get((row, col), 0)
+        if value == old:
+            return
+        if value == 0:
+            del self.givens[(row, col)]
+        else:
+            self.givens[(row, col)] = value
+        if old != 0:
+            #relaxing (or changing) a given: recompute the root state
+            self._propagate_root()
+            return
+
+        #tightening: prune the other values and propagate from this cell
+        self._load_root()
+        if not self.root_ok:
+            return
+        var = self.var_array[row][col]
+        pruned = []
+        for val in var.cur_domain():
+            if val != value:
+                var.prune_value(val)
+                pruned.append((var, val))
+        self.root_prunings.extend(pruned)
+        if var.cur_domain_size() == 0:
+            self.root_ok = False
+            return
+        self._propagate_from(var)
+
+    def set_inequality(self, row, col, symbol):
+        '''Set the inequality between cells (row, col) and (row, col+1) to
+           '<', '>' or '.' (no inequality)'''
+        if symbol != '.' and symbol not in self.ineq_tables:
+            print("Trying to set unknown inequality", symbol, "at cell", (row, col))
+            return
+        old = self.ineqs.get((row, col), ('.', None))
+        if symbol == old[0]:
+            return
+        if old[1] is not None:
+            self.csp.remove_constraint(old[1])
+            del self.ineqs[(row, col)]
+        if symbol == '.':
+            self._propagate_root()
+            return
+        self._add_ineq_constraint(row, col, symbol)
+        if old[1] is not None:
+            #the old inequality was replaced: recompute the root state
+            self._propagate_root()
+            return
+        self._load_root()
+        if self.root_ok:
+            self._propagate_from(self.var_array[row][col])
+
+    def board(self):
+        '''return the current board in the grid format of the models'''
+        grid = []
+        for i in range(self.n):
+            row = []
+            for j in range(self.n):
+                row.append(self.givens.get((i, j), 0))
+                if j < self.n - 1:
+                    row.append(self.ineqs.get((i, j), ('.', None))[0])
+            grid.append(row)
+        return grid
+
+    #
+    #solving
+    #
+
+    def solve(self):
+        '''Solve the current board. Returns the solution as a list of rows
+           of values (the variables are also left assigned), or None if the
+           board has no solution.'''
+        if not self.root_ok:
+            self.solution = None
+            return None
+
+        self.solver = BT(self.csp)
+        self.solver.quiet_on()
+        self.solver.root_cache_off()    #the session keeps its own root state
+        if not self.solver.bt_search(self._root_prop, self.var_ord, self.val_ord, hint=self.solution):
+            self.solution = None
+            return None
+        self.solution = dict((var, var.get_assigned_value()) for var in self.csp.get_all_vars())
+        return [[var.get_assigned_value() for var in row] for row in self.var_array]
+
+    def count_solutions(self, limit=2):
+        '''Count the solutions of the current board, stopping once limit
+           of them are found (so the default is a uniqueness check). The
+           search starts from the saved root state and is warm-started
+           like solve(); the first solution found becomes the warm start
+           of the next call. The solutions found are left in
+           self.solver.solutions.'''
+        if not self.root_ok:
+            return 0
+        self.solver = BT(self.csp)
+        self.solver.root_cache_off()
+        count = self.solver.count_solutions(self._root_prop, self.var_ord,
+                                            self.val_ord, limit, self.solution)
+        if count:
+            self.solution = self.solver.solutions[0]
+        return count
+
+    #
+    #internal methods
+    #
+
+    def _root_prop(self, csp, newVar=None):
+        #the root state is already known: just reapply it
+        if newVar == None:
+            for var, val in self.root_prunings:
+                var.prune_value(val)
+            return True, list(self.root_prunings)
+        return self.propagator(csp, newVar)
+
+    def _add_ineq_constraint(self, row, col, symbol):
+        lp = self.var_array[row][col]
+        rp = self.var_array[row][col + 1]
+        con = Constraint(f'Ineq{row}{2*col+1}', [lp, rp])
+        con.set_table(self.ineq_tables[symbol])
+        con.subscribe(EVT_BOUND)
+        self.csp.add_constraint(con)
+        self.ineqs[(row, col)] = (symbol, con)
+
+    def _load_root(self):
+        '''Put the variable domains back into the saved root state'''
+        for var in self.csp.get_all_vars():
+            if var.is_assigned():
+                var.unassign()
+            var.restore_curdom()
+        for var, val in self.root_prunings:
+            var.prune_value(val)
+
+    def _propagate_root(self):
+        '''Compute the root state from scratch: apply the givens then
+           propagate over all constraints'''
+        for var in self.csp.get_all_vars():
+            if var.is_assigned():
+                var.unassign()
+            var.restore_curdom()
+        self.root_prunings = []
+        for (row, col), value in self.givens.items():
+            var = self.var_array[row][col]
+            for val in var.cur_domain():
+                if val != value:
+                    var.prune_value(val)
+                    self.root_prunings.append((var, val))
+        self.root_ok, prunings = self.propagator(self.csp)
+        self.root_prunings.extend(prunings)
+
+    def _propagate_from(self, var):
+        '''Propagate a tightening at var from the current root state'''
+        status, prunings = self.propagator(self.csp, var)
+        self.root_prunings.extend(prunings)
+        self.root_ok = status
@@ -0,0 +1,324 @@
+#!/usr/bin/env python3
+"""
+Local Futoshiki solver daemon.
+
+Keeps a pool of worker processes with the modules imported and the model
+tables of common board sizes already built, so a request only pays for
+building its board and solving it. Small requests arriving close together
+are batched into a single task for a worker.
+
+Usage:
+  python futoshiki_daemon.py serve [--socket PATH] [--workers N]
+  python futoshiki_daemon.py solve BOARD_FILE [--socket PATH]
+  python futoshiki_daemon.py bench [--socket PATH] [--requests N] [--concurrency C] [--size n]
+
+Protocol:
+Requests and replies are single lines of JSON over a Unix stream socket.
+A connection may send any number of requests, without waiting for
+replies, and receives one reply per request, in order. SolverClient
+implements the client side.
+    request: {"board": <grid in the futoshiki_csp format>,
+              "model": 1 or 2 (default 1),
+              "propagator": "BT", "FC", "GAC", "SAC", "FUTOSHIKI" or
+                            "ADAPTIVE" (default "GAC")}
+    reply:   {"status": "solved", "unsat" or "error",
+              "solution": <list of rows of values> or null,
+              "nodes": <decisions made>, "solve_time": <seconds of CPU>,
+              "error": <message, only if status is "error">}
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import queue
+import socket
+import socketserver
+import sys
+import threading
+import time
+
+SOCKET_PATH = "/tmp/futoshiki_solver.sock"
+BATCH_SIZE = 16         #most requests handed to a worker in one task
+BATCH_WAIT = 0.002      #seconds to wait for more requests to fill a batch
+WARM_SIZES = {1: range(3, 10), 2: range(3, 8)}  #model tables built in each worker
+
+#######################################
+# WORKERS
+#######################################
+def _warm_worker():
+    """Pool initializer: import the solver and build the cached tables."""
+    import futoshiki_csp
+    for model, sizes in WARM_SIZES.items():
+        for n in sizes:
+            futoshiki_csp._model_tables(n, model)
+
+def _solve_one(request):
+    import cspbase
+    import propagators
+    import futoshiki_csp
+
+    props = {"BT": propagators.prop_BT, "FC": propagators.prop_FC,
+             "GAC": propagators.prop_GAC, "SAC": propagators.prop_SAC,
+             "FUTOSHIKI": None, "ADAPTIVE": None}  #built per board, see below
+    try:
+        board = request["board"]
+        model = request.get("model", 1)
+        propagator = props[request.get("propagator", "GAC")]
+        if model == 1:
+            csp, var_array = futoshiki_csp.futoshiki_csp_model_1(board)
+        else:
+            csp, var_array = futoshiki_csp.futoshiki_csp_model_2(board)
+        if propagator is None and request["propagator"] == "FUTOSHIKI":
+            propagator = propagators.FutoshikiPropagator(var_array)
+        elif propagator is None:
+            propagator = propagators.AdaptivePropagator()
+        solver = cspbase.BT(csp)
+        solver.quiet_on()
+        status = solver.bt_search(propagator, propagators.ord_mrv)
+    except Exception as e:
+        return {"status": "error", "solution": None, "nodes": 0,
+                "solve_time": 0, "error": repr(e)}
+
+    solution = None
+    if status:
+        solution = [[v.get_assigned_value() for v in row] for row in var_array]
+    return {"status": "solved" if status else "unsat", "solution": solution,
+            "nodes": solver.nDecisions, "solve_time": solver.runtime}
+
+def _solve_batch(requests):
+    """Worker task: solve a batch of requests."""
+    return [_solve_one(r) for r in requests]
+
+#######################################
+# SERVER
+#######################################
+class _Pending:
+    """A request waiting for its reply."""
+    def __init__(self, request):
+        self.request = request
+        self.reply = None
+        self.event = threading.Event()
+
+class SolverDaemon(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, path=SOCKET_PATH, workers=None):
+        if os.path.exists(path):
+            os.unlink(path)
+        super().__init__(path, _Handler)
+        self.workers = workers or os.cpu_count()
+        self.pool = multiprocessing.Pool(self.workers, initializer=_warm_worker)
+        self.pending = queue.Queue()
+        self.batcher = threading.Thread(target=self._batch_loop, daemon=True)
+        self.batcher.start()
+
+    def submit(self, request):
+        """Queue a request; returns a _Pending whose event is set once its
+        reply is ready."""
+        p = _Pending(request)
+        self.pending.put(p)
+        return p
+
+    def _batch_loop(self):
+        """Group queued requests into batches and hand them to the pool."""
+        while True:
+            batch = [self.pending.get()]
+            deadline = time.perf_counter() + BATCH_WAIT
+            while len(batch) < BATCH_SIZE:
+                timeout = deadline - time.perf_counter()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(self.pending.get(timeout=timeout))
+                except queue.Empty:
+                    break
+            #spread the batch over the workers rather than queueing it all
+            #behind one of them
+            size = -(-len(batch) // self.workers)
+            for i in range(0, len(batch), size):
+                chunk = batch[i:i + size]
+                self.pool.apply_async(_solve_batch, ([p.request for p in chunk],),
+                                      callback=lambda replies, chunk=chunk: self._deliver(chunk, replies),
+                                      error_callback=lambda e, chunk=chunk: self._fail(chunk, e))
+
+    def _deliver(self, batch, replies):
+        for p, reply in zip(batch, replies):
+            p.reply = reply
+            p.event.set()
+
+    def _fail(self, batch, error):
+        self._deliver(batch, [{"status": "error", "solution": None, "nodes": 0,
+                               "solve_time": 0, "error": repr(error)}] * len(batch))
+
+    def server_close(self):
+        super().server_close()
+        self.pool.terminate()
+        if os.path.exists(self.server_address):
+            os.unlink(self.server_address)
+
+class _Handler(socketserver.StreamRequestHandler):
+    def handle(self):
+        #Requests are submitted as soon as they are read, so a client that
+        #pipelines several boards gets them batched; a writer thread sends
+        #the replies back in request order.
+        replies = queue.Queue()
+        writer = threading.Thread(target=self._write_replies, args=(replies,))
+        writer.start()
+        try:
+            for line in self.rfile:
+                if not line.strip():
+                    continue
+                try:
+                    request = json.loads(line)
+                except ValueError as e:
+                    p = _Pending(None)
+                    p.reply = {"status": "error", "solution": None, "nodes": 0,
+                               "solve_time": 0, "error": "bad request: %s" % e}
+                    p.event.set()
+                else:
+                    p = self.server.submit(request)
+                replies.put(p)
+        finally:
+            replies.put(None)
+            writer.join()
+
+    def _write_replies(self, replies):
+        while True:
+            p = replies.get()
+            if p is None:
+                return
+            p.event.wait()
+            try:
+                self.wfile.write((json.dumps(p.reply) + "\n").encode())
+                self.wfile.flush()
+            except OSError:
+                #client went away; keep draining so handle() can finish
+                pass
+
+#######################################
+# CLIENT
+#######################################
+class SolverClient:
+    """Connection to a running daemon."""
+
+    def __init__(self, path=SOCKET_PATH):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.connect(path)
+        self.rfile = self.sock.makefile("rb")
+
+    def solve(self, board, model=1, propagator="GAC"):
+        """Send one board and return the daemon's reply (a dict)."""
+        return self.solve_many([board], model, propagator)[0]
+
+    def solve_many(self, boards, model=1, propagator="GAC"):
+        """Send several boards at once (pipelined) and return the replies."""
+        data = "".join(json.dumps({"board": b, "model": model, "propagator": propagator}) + "\n"
+                       for b in boards)
+        self.sock.sendall(data.encode())
+        return [json.loads(self.rfile.readline()) for b in boards]
+
+    def close(self):
+        self.rfile.close()
+        self.sock.close()
+
+#######################################
+# LOAD GENERATOR
+#######################################
+def sample_board(gen):
+    """Return a solvable board from gen, a FutoshikiGenerator: a random
+    Latin square with some of its cells given and some of its
+    inequalities shown."""
+    return gen.sample(0.15)
+
+def percentile(values, p):
+    values = sorted(values)
+    k = min(len(values) - 1, int(round(p / 100.0 * (len(values) - 1))))
+    return values[k]
+
+def bench(path, n_requests, concurrency, size, model, propagator, seed=0):
+    """Send n_requests boards from concurrency client threads and print the
+    throughput and latency percentiles."""
+    from futoshiki_generator import FutoshikiGenerator
+    gen = FutoshikiGenerator(size, model, ineq_rate=0.3, seed=seed)
+    boards = [sample_board(gen) for i in range(n_requests)]
+    latencies = []
+    errors = []
+    lock = threading.Lock()
+
+    def client_thread(my_boards):
+        client = SolverClient(path)
+        for b in my_boards:
+            t = time.perf_counter()
+            reply = client.solve(b, model, propagator)
+            dt = time.perf_counter() - t
+            with lock:
+                latencies.append(dt)
+                if reply["status"] != "solved":
+                    errors.append(reply)
+        client.close()
+
+    threads = [threading.Thread(target=client_thread, args=(boards[i::concurrency],))
+               for i in range(concurrency)]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - start
+
+    print("%d requests (%dx%d, model %d, %s) from %d clients in %.3fs"
+          % (n_requests, size, size, model, propagator, concurrency, elapsed))
+    print("throughput: %.1f boards/s" % (n_requests / elapsed))
+    print("latency ms: p50 %.2f  p90 %.2f  p99 %.2f  max %.2f"
+          % tuple(1000 * percentile(latencies, p) for p in (50, 90, 99, 100)))
+    if errors:
+        print("%d requests not solved, first: %s" % (len(errors), errors[0]))
+
+#######################################
+# MAIN FUNCTION
+#######################################
+def main():
+    parser = argparse.ArgumentParser(description="Local Futoshiki solver daemon.")
+    parser.add_argument("--socket", default=SOCKET_PATH, help="Unix socket path")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("serve", help="run the daemon")
+    p.add_argument("--workers", type=int, default=None, help="worker processes (default: CPU count)")
+
+    p = sub.add_parser("solve", help="solve a board read as JSON from a file ('-' for stdin)")
+    p.add_argument("board_file")
+    p.add_argument("--model", type=int, default=1)
+    p.add_argument("--propagator", default="GAC")
+
+    p = sub.add_parser("bench", help="send generated boards and report throughput and latency")
+    p.add_argument("--requests", type=int, default=500)
+    p.add_argument("--concurrency", type=int, default=8)
+    p.add_argument("--size", type=int, default=5)
+    p.add_argument("--model", type=int, default=1)
+    p.add_argument("--propagator", default="GAC")
+    p.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    if args.command == "serve":
+        server = SolverDaemon(args.socket, args.workers)
+        print("Futoshiki solver listening on", args.socket)
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+    elif args.command == "solve":
+        f = sys.stdin if args.board_file == "-" else open(args.board_file)
+        board = json.load(f)
+        client = SolverClient(args.socket)
+        print(json.dumps(client.solve(board, args.model, args.propagator)))
+        client.close()
+    else:
+        bench(args.socket, args.requests, args.concurrency, args.size,
+              args.model, args.propagator, args.seed)
+
+
+if __name__ == "__main__":
+    main()
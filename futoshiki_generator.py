@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+"""
+Futoshiki board generator.
+
+Produces n x n boards with a unique solution, in the grid format read by
+futoshiki_csp (rows of cell values, 0 for empty, with '<', '>' or '.'
+between neighbouring cells).
+
+Each board is made in four steps:
+  1. sample a random Latin square (solve the empty board with a random
+     value ordering); it is the solution of the board
+  2. insert inequalities: each pair of horizontal neighbours shows its
+     true inequality with probability ineq_rate
+  3. add clues from the square until the board has a unique solution,
+     each time giving a cell on which a second solution disagrees with
+     the square
+  4. remove clues, in random order, as long as the solution stays unique
+
+All the uniqueness checks of a board run on one FutoshikiSession: the
+model is built once, adding a clue only propagates from its cell, and
+every check stops as soon as a second solution is found.
+
+Usage:
+  python futoshiki_generator.py [--size n] [--count N] [--ineq-rate P]
+                                [--model 1|2] [--seed S] [--no-minimize]
+
+Prints one board per line as JSON and reports the throughput, in boards
+per second, on stderr.
+"""
+
+import argparse
+import json
+import random
+import sys
+import time
+
+from cspbase import *
+from propagators import *
+from futoshiki_csp import *
+
+class FutoshikiGenerator:
+    """Generator of unique-solution boards of one size."""
+
+    def __init__(self, n, model=1, ineq_rate=0.3, minimize=True, seed=None, propagator=prop_GAC):
+        self.n = n
+        self.model = model
+        self.ineq_rate = ineq_rate
+        self.minimize = minimize
+        self.propagator = propagator
+        self.rng = random.Random(seed)
+        self.nChecks = 0            #uniqueness checks made so far
+
+        #empty board used to sample Latin squares
+        empty = [[0 if j % 2 == 0 else '.' for j in range(2 * n - 1)] for i in range(n)]
+        self.square_csp, self.square_vars = futoshiki_csp_model_1(empty)
+
+    def latin_square(self):
+        """Return a random n x n Latin square as a list of rows."""
+        solver = BT(self.square_csp)
+        solver.quiet_on()
+        solver.bt_search(prop_GAC, ord_mrv,
+                         lambda csp, var: self.rng.sample(var.cur_domain(), var.cur_domain_size()))
+        square = [[var.get_assigned_value() for var in row] for row in self.square_vars]
+        solver.restore_all_variable_domains()
+        return square
+
+    def generate(self):
+        """Return a new board (grid format) with a unique solution."""
+        n = self.n
+        square = self.latin_square()
+        board = self._board(square)
+
+        session = FutoshikiSession(board, self.model, self.propagator)
+        #warm start every check from the square, so it is found first and
+        #the search goes straight on to looking for a second solution
+        session.solution = dict((session.var_array[i][j], square[i][j])
+                                for i in range(n) for j in range(n))
+
+        #add clues until the solution is unique
+        while self._count(session) > 1:
+            other = session.solver.solutions[1]
+            cells = [(i, j) for i in range(n) for j in range(n)
+                     if other[session.var_array[i][j]] != square[i][j]]
+            i, j = self.rng.choice(cells)
+            session.set_given(i, j, square[i][j])
+
+        #remove the clues that are not needed
+        if self.minimize:
+            givens = list(session.givens)
+            self.rng.shuffle(givens)
+            for i, j in givens:
+                session.set_given(i, j, 0)
+                if self._count(session) > 1:
+                    session.set_given(i, j, square[i][j])
+
+        return session.board()
+
+    def sample(self, given_rate=0.0):
+        """Return a random board (grid format) that has a solution, not
+        necessarily a unique one: each cell of a random Latin square is
+        given with probability given_rate, and each inequality shown with
+        probability ineq_rate."""
+        return self._board(self.latin_square(), given_rate)
+
+    def _board(self, square, given_rate=0.0):
+        #square's inequalities (and, if given_rate, some of its cells)
+        n = self.n
+        board = []
+        for i in range(n):
+            row = []
+            for j in range(n):
+                row.append(square[i][j] if given_rate and self.rng.random() < given_rate else 0)
+                if j < n - 1:
+                    if self.rng.random() < self.ineq_rate:
+                        row.append('<' if square[i][j] < square[i][j + 1] else '>')
+                    else:
+                        row.append('.')
+            board.append(row)
+        return board
+
+    def _count(self, session):
+        self.nChecks = self.nChecks + 1
+        return session.count_solutions(2)
+
+#######################################
+# MAIN FUNCTION
+#######################################
+def main():
+    parser = argparse.ArgumentParser(description="Generate Futoshiki boards with a unique solution.")
+    parser.add_argument("--size", type=int, default=5)
+    parser.add_argument("--count", type=int, default=10, help="number of boards")
+    parser.add_argument("--ineq-rate", type=float, default=0.3,
+                        help="probability that a pair of neighbours shows its inequality")
+    parser.add_argument("--model", type=int, default=1)
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--no-minimize", action="store_true",
+                        help="skip removing the clues that are not needed")
+    args = parser.parse_args()
+
+    gen = FutoshikiGenerator(args.size, args.model, args.ineq_rate,
+                             not args.no_minimize, args.seed)
+    start = time.perf_counter()
+    for k in range(args.count):
+        print(json.dumps(gen.generate()))
+    elapsed = time.perf_counter() - start
+    print("%d boards (%dx%d) in %.3fs: %.1f boards/s, %d uniqueness checks"
+          % (args.count, args.size, args.size, elapsed, args.count / elapsed, gen.nChecks),
+          file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
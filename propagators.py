@@ -70,22 +70,75 @@ var_ordering == a function with the following template
 
     var_ordering returns the next Variable to be assigned, as per the definition
     of the heuristic it implements.
+
+val_ordering == a function with the following template
+    val_ordering(csp, var)
+        ==> returns list of Values
+
+    val_ordering returns the values of var's current domain in the order
+    they should be tried.
    '''
 
+import collections
+import math
+import time
+
+from cspbase import EVT_VALUE, EVT_BOUND, EVT_FIX, N_COST_CLASSES
+
+class PropagationQueue:
+    '''Queue of constraints waiting to be revised, with one FIFO level per
+       cost class (see Constraint.cost_class). pop returns a constraint of
+       the cheapest non-empty level, so cheap constraints that can detect
+       a wipe-out are revised before expensive ones. A constraint is never
+       in the queue twice.'''
+
+    def __init__(self, cons=()):
+        self.levels = [collections.deque() for i in range(N_COST_CLASSES)]
+        self.queued = set()
+        for c in cons:
+            self.push(c)
+
+    def push(self, c):
+        '''add c to the queue unless it is already waiting'''
+        if not c in self.queued:
+            self.queued.add(c)
+            self.levels[c.cost_class()].append(c)
+
+    def pop(self):
+        '''remove and return the oldest constraint of the cheapest class'''
+        for level in self.levels:
+            if level:
+                c = level.popleft()
+                self.queued.discard(c)
+                return c
+        return None
+
+    def __len__(self):
+        return len(self.queued)
+
+    def __contains__(self, c):
+        return c in self.queued
 
 def prop_BT(csp, newVar=None):
     '''Do plain backtracking propagation. That is, do no 
-    propagation at all. Just check fully instantiated constraints'''
+    propagation at all. Just check fully instantiated constraints.
+
+    Each constraint watches one of its unassigned variables (see
+    CSP.set_watch). When newVar is assigned only the constraints watching
+    it are looked at: those that still have an unassigned variable move
+    their watch to it, and only those left fully assigned are checked.'''
 
     if not newVar:
+        csp.reset_watches()
         return True, []
-    for c in csp.get_cons_with_var(newVar):
-        if c.get_n_unasgn() == 0:
+    for c in csp.get_cons_watching(newVar):
+        if csp.set_watch(c) is None:
             vals = []
             vars = c.get_scope()
             for var in vars:
                 vals.append(var.get_assigned_value())
             if not c.check(vals):
+                c.weight += 1
                 return False, []
     return True, []
 
@@ -109,7 +162,7 @@ def prop_FC(csp, newVar=None):
     for c in cons:
         if c.get_n_unasgn() == 1:
             
-            unassigned_variable = c.get_unasgn_vars()[0] #Get unassigned variable
+            unassigned_variable = c.get_last_unasgn_var() #Get unassigned variable
 
             #See if any value in the domain of the unassigned variable has a support
             for i in unassigned_variable.cur_domain():
@@ -124,6 +177,7 @@ def prop_FC(csp, newVar=None):
             
             #If the domain becomes empty, return domain wipeout
             if unassigned_variable.cur_domain_size() == 0:
+                c.weight += 1   #for weighted degree ordering
                 all_prunes = []
                 #Add the pruned values to the list of all pruned values
                 for i in pruned_values.values():  
@@ -144,27 +198,39 @@ def prop_FC(csp, newVar=None):
 def prop_GAC(csp, newVar=None):
     '''Do GAC propagation. If newVar is None we do initial GAC enforce 
        processing all constraints. Otherwise we do GAC enforce with
-       constraints containing newVar on GAC Queue'''
+       constraints containing newVar on GAC Queue. When a variable's
+       domain shrinks only the constraints subscribed to the kind of
+       change made (see Constraint.subscribe) are put back on the queue.'''
     #IMPLEMENT
 
-    #Create a dictionairy for pruned values
-    pruned_values = {}
-
     #If there is no newVar, make a queue all the constraints in the CSP, otherwise make a queue of all constraints with the variable in scope
     if newVar == None:
-        queue = list(csp.get_all_cons())  
+        return gac_enforce(csp, csp.get_all_cons())
     else:
-        queue = list(csp.get_cons_with_var(newVar))  
+        return gac_enforce(csp, csp.get_cons_with_var(newVar))
+
+def gac_enforce(csp, cons):
+    '''Run GAC propagation starting with the constraints cons on the queue.
+       Returns (True/False, prunings) like a propagator.'''
+
+    #Create a dictionairy for pruned values
+    pruned_values = {}
+
+    #Cheapest constraints are taken off the queue first
+    queue = PropagationQueue(cons)
 
     #While the queue is not empty
     while len(queue) > 0:
-        #Take the first constraint
-        constraint = queue.pop(0)
+        #Take the next constraint
+        constraint = queue.pop()
 
         #For all variables in the contraints scope
         for i in constraint.get_scope(): 
+            #Collect the kinds of change made to i's domain
+            events = 0
             #For all values in the variables domain        
-            for j in i.cur_domain():  
+            dom = i.cur_domain()
+            for j in dom:  
                 #Check if a constraint has a support for value i          
                 if constraint.has_support(i,j) == False:    
                     #If no support, prune i
@@ -173,20 +239,27 @@ def prop_GAC(csp, newVar=None):
                     if i not in pruned_values:
                         pruned_values[i] = []
                     pruned_values[i].append((i,j))
+                    events |= EVT_VALUE
+                    if j == dom[0] or j == dom[-1]:
+                        events |= EVT_BOUND
                     
                     #If we get a domain wipeout
                     if i.cur_domain_size() == 0:
+                        constraint.weight += 1  #for weighted degree ordering
                         all_prunes = []
                         #Add the pruned values to the list of all pruned values
                         for i in pruned_values.values():  
                             for j in i:  
                                 all_prunes.append(j)  
                         return False, all_prunes    #Return no support (False), and all the pruned values
-                    
-                    #Add all the constraints with variable i in scope back to the queue if it is not in the queue currently
-                    for remaining_constraints in csp.get_cons_with_var(i):
-                        if remaining_constraints not in queue:
-                            queue.append(remaining_constraints)
+
+            if events:
+                if i.cur_domain_size() == 1:
+                    events |= EVT_FIX
+                #Add the constraints with variable i in scope that care about these changes back to the queue if they are not in the queue currently
+                for remaining_constraints in csp.get_cons_with_var(i):
+                    if remaining_constraints.events & events:
+                        queue.push(remaining_constraints)
 
     all_prunes = []
     #Add the pruned values to the list of all pruned values
@@ -197,6 +270,365 @@ def prop_GAC(csp, newVar=None):
 
 
 
+SAC_TIME_BUDGET = 10.0   #default seconds of CPU time prop_SAC spends probing
+
+def _sac_probe(csp, propagator, var, val):
+    '''Tentatively assign var = val and propagate. Returns True if no
+       wipe-out was found; all changes are undone before returning'''
+    var.assign(val)
+    status, prunings = propagator(csp, var)
+    for v, a in prunings:
+        v.unprune_value(a)
+    var.unassign()
+    return status
+
+def sac_enforce(csp, propagator=prop_GAC, time_budget=None, incremental=False, stats=None):
+    '''Enforce singleton arc consistency (SAC) on the unassigned variables
+       of the csp. Every (var, val) is probed by assigning it and running
+       propagator; values whose probe ends in a wipe-out are pruned and the
+       pruning propagated. Probing repeats until nothing more is pruned
+       (SAC-1) or until time_budget seconds of CPU time are used. Stopping
+       early is safe: every value pruned is inconsistent.
+
+       If incremental is True a probe is only repeated when a value that
+       survived it has since been pruned (in the style of SAC-Opt),
+       instead of sweeping over every value again.
+
+       Returns (True/False, prunings) like a propagator. If stats is a
+       dict it is filled with the number of probes made, values pruned
+       and whether the time budget ran out.'''
+
+    stime = time.process_time()
+    if stats is None:
+        stats = dict()
+    stats['probes'] = 0
+    stats['timed_out'] = False
+
+    status, all_prunes = propagator(csp)
+    all_prunes = list(all_prunes)
+    stats['pruned'] = len(all_prunes)
+    if not status:
+        return False, all_prunes
+
+    def out_of_time():
+        if time_budget is not None and time.process_time() - stime > time_budget:
+            stats['timed_out'] = True
+            return True
+        return False
+
+    def prune_and_propagate(var, val):
+        '''remove a value that failed its probe, then propagate the
+           removal. Returns (status, values pruned)'''
+        var.prune_value(val)
+        pruned = [(var, val)]
+        if var.cur_domain_size() == 0:
+            return False, pruned
+        status, prunings = propagator(csp, var)
+        return status, pruned + list(prunings)
+
+    if not incremental:
+        #SAC-1: sweep over all values until a sweep prunes nothing
+        changed = True
+        while changed:
+            changed = False
+            for var in csp.get_all_unasgn_vars():
+                for val in var.cur_domain():
+                    if out_of_time():
+                        return True, all_prunes
+                    if not var.in_cur_domain(val):
+                        continue
+                    stats['probes'] += 1
+                    if not _sac_probe(csp, propagator, var, val):
+                        status, pruned = prune_and_propagate(var, val)
+                        all_prunes.extend(pruned)
+                        stats['pruned'] += len(pruned)
+                        changed = True
+                        if not status:
+                            return False, all_prunes
+        return True, all_prunes
+
+    #Incremental: remember which values survived each probe, and only
+    #probe (var, val) again once one of those values has been pruned
+    depends = dict()
+    queue = collections.deque((var, val) for var in csp.get_all_unasgn_vars() for val in var.cur_domain())
+    queued = set(queue)
+    while queue:
+        if out_of_time():
+            return True, all_prunes
+        var, val = queue.popleft()
+        queued.discard((var, val))
+        if not var.in_cur_domain(val):
+            continue
+        stats['probes'] += 1
+        var.assign(val)
+        status, prunings = propagator(csp, var)
+        if status:
+            for y in csp.get_all_unasgn_vars():
+                for b in y.cur_domain():
+                    depends.setdefault((y, b), []).append((var, val))
+        for v, a in prunings:
+            v.unprune_value(a)
+        var.unassign()
+        if status:
+            continue
+
+        status, pruned = prune_and_propagate(var, val)
+        all_prunes.extend(pruned)
+        stats['pruned'] += len(pruned)
+        if not status:
+            return False, all_prunes
+        for yb in pruned:
+            for probe in depends.pop(yb, []):
+                if not probe in queued and probe[0].in_cur_domain(probe[1]):
+                    queue.append(probe)
+                    queued.add(probe)
+    return True, all_prunes
+
+def prop_SAC(csp, newVar=None):
+    '''Singleton arc consistency at the root (before any assignments,
+       limited to SAC_TIME_BUDGET seconds), GAC during search'''
+    if newVar == None:
+        return sac_enforce(csp, prop_GAC, SAC_TIME_BUDGET, incremental=True)
+    return prop_GAC(csp, newVar)
+
+class FutoshikiPropagator:
+    '''Propagator for the CSPs built by futoshiki_csp_model_1/2 that adds
+       Latin-square reasoning over the rows and columns to a base
+       propagator (GAC by default):
+
+       - hidden single: a value possible in only one cell of a row or
+         column is that cell's value (and a value possible in no cell of
+         a row or column is a dead end)
+       - naked pair: two cells of a row or column with the same two
+         values left take both values, so no other cell can have them
+       - hidden pair: two values each possible in only the same two cells
+         of a row or column fill those cells, which can have nothing else
+
+       Bounds along chains of inequalities come from the base propagator
+       revising the inequality constraints. The rules and the base
+       propagator are run in turn until neither prunes anything.
+
+       var_array is the list of rows of Variables returned by the model:
+
+       csp, var_array = futoshiki_csp_model_1(board)
+       BT(csp).bt_search(FutoshikiPropagator(var_array), ord_mrv)
+    '''
+
+    def __init__(self, var_array, base=prop_GAC):
+        self.base = base
+        self.n = len(var_array)
+        self.values = list(range(1, self.n + 1))
+        self.units = [list(row) for row in var_array] + \
+                     [[row[j] for row in var_array] for j in range(self.n)]
+        #the row and the column of each cell
+        self.units_of = dict()
+        for unit in self.units:
+            for var in unit:
+                self.units_of.setdefault(var, []).append(unit)
+
+    def __call__(self, csp, newVar=None):
+        status, all_prunes = self.base(csp, newVar)
+        all_prunes = list(all_prunes)
+
+        #Before any assignment look at every row and column; after one,
+        #only those where something changed can give anything new
+        if newVar == None:
+            units = self.units
+        else:
+            changed = set(var for var, val in all_prunes)
+            changed.add(newVar)
+            units = self.touched_units(changed)
+
+        while status and units:
+            status, pruned = self.latin_rules(units)
+            all_prunes.extend(pruned)
+            if not status or not pruned:
+                break
+            #let the base propagator follow up on what the rules removed
+            changed = set(var for var, val in pruned)
+            for var in list(changed):
+                status, prunings = self.base(csp, var)
+                all_prunes.extend(prunings)
+                changed.update(v for v, val in prunings)
+                if not status:
+                    break
+            units = self.touched_units(changed)
+        return status, all_prunes
+
+    def touched_units(self, vars):
+        '''return the rows and columns containing any of vars'''
+        units = []
+        seen = set()        #ids of the units already in units
+        for var in vars:
+            for unit in self.units_of.get(var, []):
+                if not id(unit) in seen:
+                    seen.add(id(unit))
+                    units.append(unit)
+        return units
+
+    def latin_rules(self, units):
+        '''Apply the hidden single, naked pair and hidden pair rules once
+           to each row or column in units. Returns (True/False, prunings).'''
+        pruned = []
+
+        def prune(var, val):
+            if not var.is_assigned() and var.in_cur_domain(val):
+                var.prune_value(val)
+                pruned.append((var, val))
+            return var.cur_domain_size() > 0
+
+        for unit in units:
+            #cells each value is still possible in
+            places = dict((val, [var for var in unit if var.in_cur_domain(val)])
+                          for val in self.values)
+
+            for val, cells in places.items():
+                if not cells:
+                    return False, pruned
+                #hidden single
+                if len(cells) == 1 and cells[0].cur_domain_size() > 1:
+                    for other in cells[0].cur_domain():
+                        if other != val:
+                            prune(cells[0], other)
+
+            #naked pairs
+            pairs = dict()
+            for var in unit:
+                if not var.is_assigned() and var.cur_domain_size() == 2:
+                    pairs.setdefault(tuple(var.cur_domain()), []).append(var)
+            for pair, cells in pairs.items():
+                if len(cells) == 2:
+                    for var in unit:
+                        if not var in cells:
+                            for val in pair:
+                                if not prune(var, val):
+                                    return False, pruned
+                elif len(cells) > 2:
+                    #three cells sharing two values
+                    return False, pruned
+
+            #hidden pairs (recomputed, the rules above may have pruned)
+            places = dict((val, [var for var in unit if var.in_cur_domain(val)])
+                          for val in self.values)
+            doubles = dict()
+            for val, cells in places.items():
+                if len(cells) == 2:
+                    doubles.setdefault(tuple(cells), []).append(val)
+            for cells, vals in doubles.items():
+                if len(vals) == 2:
+                    for var in cells:
+                        for other in var.cur_domain():
+                            if not other in vals:
+                                prune(var, other)
+                elif len(vals) > 2:
+                    #three values that only fit in two cells
+                    return False, pruned
+
+        return True, pruned
+
+ADAPT_DECAY = 0.8          #weight of the past in AdaptivePropagator's running averages
+ADAPT_PROBE_EVERY = 32     #calls at a depth range between measured calls
+ADAPT_WIPEOUT_VALUE = 10   #weak propagations a wipe-out found only by the strong one is worth
+ADAPT_DEPTHS = 4           #AdaptivePropagator keeps statistics for this many depth ranges
+
+class AdaptivePropagator:
+    '''Propagator choosing, at each depth of the search, between a weak
+       cheap propagator (FC by default) and a strong expensive one (GAC).
+
+       The depth of the search (share of the variables assigned in the
+       constraints of the variable just assigned) is split into
+       ADAPT_DEPTHS ranges. For each range it keeps running averages
+       of what the strong propagator saves and what it costs:
+
+         saved  = (values it prunes beyond the weak one
+                   + ADAPT_WIPEOUT_VALUE if it finds a wipe-out the weak
+                   one misses) * time of a weak call
+         cost   = time of a strong call
+
+       counting each extra pruned value as worth one weak propagation.
+       The strong propagator is used in a range while its average saved
+       is at least its average cost, the weak one otherwise.
+
+       The averages are updated by measuring calls: the first call in a
+       range, and then one call in every ADAPT_PROBE_EVERY, runs the weak
+       propagator and then the strong one on top of it, starting from
+       newVar and the variables the weak one pruned, so what the strong
+       one adds is seen directly. Before any assignment the strong one
+       always runs.
+
+       search = BT(csp)
+       search.bt_search(AdaptivePropagator(), ord_mrv)
+    '''
+
+    def __init__(self, weak=prop_FC, strong=prop_GAC):
+        self.weak = weak
+        self.strong = strong
+        self.saved = dict()         #depth range --> average seconds saved by a strong call
+        self.cost = dict()          #depth range --> average seconds of a strong call
+        self.calls = dict()         #depth range --> calls since the last measured one
+        self.nStrong = 0            #calls that ran the strong propagator only
+        self.nWeak = 0              #calls that ran the weak one only
+        self.nMeasured = 0          #calls that ran both
+
+    def use_strong(self, depth):
+        '''True if the strong propagator currently pays for itself in depth range'''
+        return self.saved.get(depth, 1) >= self.cost.get(depth, 0)
+
+    def __call__(self, csp, newVar=None):
+        if newVar is None:
+            return self.strong(csp)
+
+        #depth, as the share of the variables assigned in newVar's
+        #constraints, read off their unassigned counters
+        slots = assigned = 0
+        for c in csp.get_cons_with_var(newVar):
+            slots += len(c.scope)
+            assigned += len(c.scope) - c.get_n_unasgn()
+        depth = min(ADAPT_DEPTHS * assigned // slots, ADAPT_DEPTHS - 1) if slots else ADAPT_DEPTHS - 1
+        calls = self.calls.get(depth, ADAPT_PROBE_EVERY)
+        if calls + 1 < ADAPT_PROBE_EVERY:
+            self.calls[depth] = calls + 1
+            if self.use_strong(depth):
+                self.nStrong = self.nStrong + 1
+                return self.strong(csp, newVar)
+            self.nWeak = self.nWeak + 1
+            return self.weak(csp, newVar)
+
+        #measured call
+        self.calls[depth] = 0
+        self.nMeasured = self.nMeasured + 1
+        t = time.perf_counter()
+        status, prunings = self.weak(csp, newVar)
+        weak_time = time.perf_counter() - t
+        if not status:
+            return status, prunings
+        t = time.perf_counter()
+        status, more = self._strong_from(csp, dict.fromkeys([newVar] + [var for var, val in prunings]))
+        cost = time.perf_counter() - t
+        saved = (len(more) + (0 if status else ADAPT_WIPEOUT_VALUE)) * weak_time
+        if not depth in self.cost:
+            self.saved[depth] = saved
+            self.cost[depth] = cost
+        else:
+            self.saved[depth] = ADAPT_DECAY * self.saved[depth] + (1 - ADAPT_DECAY) * saved
+            self.cost[depth] = ADAPT_DECAY * self.cost[depth] + (1 - ADAPT_DECAY) * cost
+        return status, list(prunings) + list(more)
+
+    def _strong_from(self, csp, vars):
+        '''run the strong propagator from the constraints of vars'''
+        if self.strong is prop_GAC:
+            cons = []
+            for var in vars:
+                cons.extend(csp.get_cons_with_var(var))
+            return gac_enforce(csp, cons)
+        more = []
+        for var in vars:
+            status, extra = self.strong(csp, var)
+            more.extend(extra)
+            if not status:
+                return False, more
+        return True, more
+
 def ord_mrv(csp):
     ''' return variable according to the Minimum Remaining Values heuristic '''
     #IMPLEMENT
@@ -219,4 +651,157 @@ def ord_mrv(csp):
         else:
             continue
 
-    return min_var  #Return the minimum value
\ No newline at end of file
+    return min_var  #Return the minimum value
+
+def ord_dom_wdeg(csp):
+    ''' return variable according to the dom/wdeg heuristic: the smallest
+        ratio of current domain size to weighted degree, the sum of the
+        weights of the variable's constraints that still have another
+        unassigned variable. The propagators bump a constraint's weight
+        (Constraint.weight) on every dead end it causes, so variables where
+        the search keeps failing are tried first. Weights carry over from
+        one search of the csp to the next (see CSP.reset_weights). '''
+
+    best = None
+    best_score = None
+    for var in csp.get_all_unasgn_vars():
+        wdeg = 0
+        for c in csp.get_cons_with_var(var):
+            if c.get_n_unasgn() > 1:
+                wdeg += c.weight
+        #a variable constraining nothing any more can go last
+        score = var.cur_domain_size() / wdeg if wdeg else float('inf')
+        if best is None or score < best_score:
+            best = var
+            best_score = score
+    return best
+
+IMPACT_UNKNOWN = 0.5     #impact assumed for an assignment not yet measured
+
+class ImpactOrdering:
+    '''Impact based variable ordering. The impact of an assignment
+       var = val is the share of the search space (the product of the
+       current domain sizes) that propagating it removes: 1 if it leads
+       to a dead end, 0 if it prunes nothing. The average impact of every
+       assignment is kept, updated each time the search makes it, and
+       the variable chosen is the one whose remaining values have the
+       least search space left after them, i.e. the smallest
+
+           sum over val in cur_domain(var) of (1 - impact(var = val))
+
+       Impacts are measured by the propagator returned by propagator(),
+       which wraps the one the search uses, for the variables this
+       ordering chose (it notes the size of the search space then).
+       Before any assignment it also probes every value of every
+       variable once to get starting impacts (unless probe_root is
+       False).
+
+       impact = ImpactOrdering()
+       BT(csp).bt_search(impact.propagator(prop_GAC), impact)
+    '''
+
+    def __init__(self, probe_root=True):
+        self.probe_root = probe_root
+        self.impact = dict()        #(var, val) --> average impact
+        self.count = dict()         #(var, val) --> number of measurements
+        self.chosen = dict()        #var --> log of the search space when last chosen
+
+    def __call__(self, csp):
+        best = None
+        best_score = None
+        space = 0
+        for var in csp.get_all_unasgn_vars():
+            score = 0
+            for val in var.cur_domain():
+                score += 1 - self.impact.get((var, val), IMPACT_UNKNOWN)
+            space += math.log(max(var.cur_domain_size(), 1))
+            if best is None or score < best_score:
+                best = var
+                best_score = score
+        #every value of best is tried from this same state
+        self.chosen[best] = space
+        return best
+
+    def propagator(self, base):
+        '''return base wrapped so that it records the impact of each
+           assignment it propagates'''
+        def impact_prop(csp, newVar=None):
+            if newVar is None:
+                status, prunings = base(csp)
+                if status and self.probe_root:
+                    self._probe(csp, base)
+                return status, prunings
+            if not newVar in self.chosen:
+                #not chosen by this ordering: the space before is unknown
+                return base(csp, newVar)
+            #size of the search space before newVar was assigned
+            before = self.chosen[newVar]
+            status, prunings = base(csp, newVar)
+            if status:
+                self._record(newVar, newVar.get_assigned_value(),
+                             1 - math.exp(self._log_space(csp, newVar) - before))
+            else:
+                self._record(newVar, newVar.get_assigned_value(), 1)
+            return status, prunings
+        return impact_prop
+
+    def _log_space(self, csp, skip):
+        '''log of the product of the current domain sizes of the unassigned
+           variables other than skip (0 if a domain is empty)'''
+        total = 0
+        for var in csp.vars:
+            if var is not skip and not var.is_assigned():
+                total += math.log(max(var.cur_domain_size(), 1))
+        return total
+
+    def _record(self, var, val, impact):
+        #running average of the measurements
+        k = self.count.get((var, val), 0) + 1
+        old = self.impact.get((var, val), 0)
+        self.count[(var, val)] = k
+        self.impact[(var, val)] = old + (impact - old) / k
+
+    def _probe(self, csp, base):
+        '''measure the impact of every value of every unassigned variable,
+           undoing each probe'''
+        space = self._log_space(csp, None)
+        for var in csp.get_all_unasgn_vars():
+            for val in var.cur_domain():
+                var.assign(val)
+                status, prunings = base(csp, var)
+                if status:
+                    impact = 1 - math.exp(self._log_space(csp, var) - space)
+                else:
+                    impact = 1
+                for v, a in prunings:
+                    v.unprune_value(a)
+                var.unassign()
+                self._record(var, val, impact)
+
+LCV_MAX_TABLE = 5040     #constraints with larger tables are ignored by val_lcv
+
+def val_lcv(csp, var):
+    ''' return var's current domain ordered by the Least Constraining Value
+        heuristic: values leaving the most supporting tuples in the
+        constraints shared with unassigned neighbours are tried first.
+        Constraints whose tables hold more than LCV_MAX_TABLE tuples (7!,
+        the row tables of model 2 at n = 7) are left out of the score:
+        building their support counts costs more than the ordering saves,
+        so above that size val_lcv falls back to the smaller constraints
+        and then to domain order. '''
+
+    values = var.cur_domain()
+    score = dict((val, 0) for val in values)
+
+    for c in csp.get_cons_with_var(var):
+        #Constraints with no other unassigned variables constrain nothing,
+        #and counting very large tables costs more than it saves
+        if c.get_n_unasgn() < 2 or len(c.table) > LCV_MAX_TABLE:
+            continue
+        #support counts are kept on the constraint and updated incrementally
+        counts = c.support_counts()[c.scope.index(var)]
+        for val in values:
+            score[val] += counts.get(val, 0)
+
+    #sort is stable, so ties keep domain order
+    return sorted(values, key=lambda val: -score[val])